@@ -0,0 +1,85 @@
+"""
+Measure the cold-start cost of importing utils.vector_stores and of the
+first vector store access, each in a fresh interpreter, next to the eager
+baseline.
+
+    python benchmarks/import_time.py [--runs 5]
+
+Before the lazy accessors, importing the module built the embeddings client
+and opened both Chroma collections; the baseline snippet repeats exactly that
+module-level code. Now the import is cheap and the cost moves to the first
+get_invoice_vectorstore() call, which pages that never touch vectors skip.
+The snippets run against a temporary copy of invoice_db/ and po_db/, so the
+committed stores are never modified.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SRC = os.path.join(ROOT, "src")
+STORE_DIRS = ["invoice_db", "po_db"]
+
+EAGER_BASELINE = "eager import (baseline)"
+SNIPPETS = {
+    # The module-level code of utils.vector_stores before the lazy accessors
+    EAGER_BASELINE: (
+        "from langchain_openai import OpenAIEmbeddings; "
+        "from langchain_community.vectorstores import Chroma; "
+        "from utils.embeddings import CachedEmbeddings; "
+        "embeddings = CachedEmbeddings(OpenAIEmbeddings()); "
+        "Chroma(persist_directory='invoice_db', embedding_function=embeddings, collection_name='invoices'); "
+        "Chroma(persist_directory='po_db', embedding_function=embeddings, collection_name='purchase_orders')"
+    ),
+    "import utils.vector_stores": "import utils.vector_stores",
+    "import + get_invoice_vectorstore()": (
+        "import utils.vector_stores as vs; vs.get_invoice_vectorstore()"
+    ),
+}
+
+
+def time_snippet(snippet: str, workdir: str) -> float:
+    code = (
+        "import sys, time; sys.path.insert(0, %r); start = time.perf_counter(); %s; "
+        "print(time.perf_counter() - start)" % (SRC, snippet)
+    )
+    # Building the OpenAI clients needs a key but makes no request
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY") or "sk-benchmark")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=workdir, env=env)
+    if output.returncode != 0:
+        lines = output.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"exit code {output.returncode}")
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    medians = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in STORE_DIRS:
+            if os.path.isdir(os.path.join(ROOT, name)):
+                shutil.copytree(os.path.join(ROOT, name), os.path.join(workdir, name))
+        for label, snippet in SNIPPETS.items():
+            try:
+                timings = [time_snippet(snippet, workdir) for _ in range(args.runs)]
+            except RuntimeError as e:
+                print(f"{label:40s} failed: {e}")
+                continue
+            medians[label] = statistics.median(timings)
+            print(f"{label:40s} median {medians[label] * 1000:8.1f} ms"
+                  f"  (min {min(timings) * 1000:.1f}, max {max(timings) * 1000:.1f}, runs {args.runs})")
+
+    if EAGER_BASELINE in medians and "import utils.vector_stores" in medians:
+        saved = medians[EAGER_BASELINE] - medians["import utils.vector_stores"]
+        print(f"{'import-time saving vs. baseline':40s} {saved * 1000:15.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Compare the Chroma and FAISS example stores: query latency and resident memory.
+
+    python benchmarks/vector_backends.py [--sizes 10000 100000 1000000] [--dim 1536]
+
+For every size and backend, one fresh interpreter fills a store in a temporary
+directory with random unit vectors, and a second one reopens it, runs
+--queries nearest-neighbour queries (k=2, as build_rag_prompt does) and
+reports p50/p95 latency plus the resident set size before and after opening
+the store, then times adding one write-behind batch (32 examples) to it. No embedding API calls are made; the vectors are synthetic.
+Pages of a memory-mapped FAISS index count toward RSS once a query touches
+them, but they are clean file-backed pages the OS can reclaim under pressure.
+At 1M examples and --dim 1536 the raw vectors alone take ~6 GB of disk.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+# Chroma caps the size of one insert; every FAISS add becomes one shard, so it
+# is filled in at most FAISS_MAX_SHARDS (8) batches and no merge runs.
+BATCH_SIZES = {"chroma": 5000, "faiss": 125_000}
+
+BUILD = """
+import sys
+sys.path.insert(0, {src!r})
+import numpy as np
+from benchmark_store import open_store
+from utils.vector_stores import add_texts_with_embeddings
+
+store = open_store({backend!r}, {directory!r})
+rng = np.random.default_rng(0)
+for start in range(0, {size}, {batch}):
+    count = min({batch}, {size} - start)
+    vectors = rng.standard_normal((count, {dim}), dtype="float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    texts = ["example %d" % i for i in range(start, start + count)]
+    # FaissVectorStore takes the array as is; a list of 125k x 1536 Python floats would not fit in RAM
+    add_texts_with_embeddings(store, texts, vectors if {backend!r} == "faiss" else vectors.tolist())
+if hasattr(store, "persist"):
+    store.persist()
+"""
+
+QUERY = """
+import sys, json, time
+sys.path.insert(0, {src!r})
+import numpy as np
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * {page_size} / 1e6
+
+from benchmark_store import open_store
+before = rss_mb()
+store = open_store({backend!r}, {directory!r})
+rng = np.random.default_rng(1)
+queries = rng.standard_normal(({queries}, {dim}), dtype="float32")
+queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+timings = []
+for query in queries.tolist():
+    start = time.perf_counter()
+    store.similarity_search_by_vector(query, k=2)
+    timings.append(time.perf_counter() - start)
+timings.sort()
+rss_open_mb = rss_mb() - before
+
+from utils.vector_stores import add_texts_with_embeddings
+vectors = rng.standard_normal((32, {dim}), dtype="float32")
+start = time.perf_counter()
+add_texts_with_embeddings(store, ["new %d" % i for i in range(32)], vectors.tolist())
+if hasattr(store, "persist"):
+    store.persist()
+add_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{
+    "p50_ms": timings[len(timings) // 2] * 1000,
+    "p95_ms": timings[int(len(timings) * 0.95)] * 1000,
+    "rss_open_mb": rss_open_mb,
+    "add_32_ms": add_ms,
+}}))
+"""
+
+STORE_MODULE = """
+def open_store(backend, directory):
+    if backend == "faiss":
+        from utils.faiss_store import FaissVectorStore
+        return FaissVectorStore(persist_directory=directory, collection_name="examples")
+    from langchain_community.vectorstores import Chroma
+    return Chroma(persist_directory=directory, collection_name="examples")
+"""
+
+
+def run(code: str, workdir: str) -> str:
+    env = dict(os.environ, PYTHONPATH=workdir)
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+    if output.returncode != 0:
+        lines = output.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"exit code {output.returncode}")
+    return output.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--backends", nargs="+", default=["chroma", "faiss"])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    print(f"{'backend':8s} {'size':>9s} {'p50 ms':>9s} {'p95 ms':>9s} {'RSS MB':>9s} {'add 32 ms':>10s}")
+    for size in args.sizes:
+        for backend in args.backends:
+            with tempfile.TemporaryDirectory() as workdir:
+                with open(os.path.join(workdir, "benchmark_store.py"), "w") as f:
+                    f.write(STORE_MODULE)
+                directory = os.path.join(workdir, "store")
+                params = dict(src=SRC, backend=backend, directory=directory, size=size, dim=args.dim,
+                              batch=BATCH_SIZES.get(backend, 5000), queries=args.queries, page_size=page_size)
+                try:
+                    run(BUILD.format(**params), workdir)
+                    result = json.loads(run(QUERY.format(**params), workdir))
+                except RuntimeError as e:
+                    print(f"{backend:8s} {size:9d} failed: {e}")
+                    continue
+                print(f"{backend:8s} {size:9d} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f} "
+                      f"{result['rss_open_mb']:9.1f} {result['add_32_ms']:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,49 @@
 import sys, re
 import os
 import base64
+import hashlib
 import streamlit as st
 import json
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from streamlit_option_menu import option_menu
 
+# Load environment variables: use Streamlit secrets (Cloud) if available; otherwise, load .env locally.
+# This runs before the core imports, which read their settings from the environment.
+if "OPENAI_API_KEY" in st.secrets:
+    os.environ["OPENAI_API_KEY"] = st.secrets["OPENAI_API_KEY"]
+else:
+    load_dotenv()
+
 from core.validation_engine import InvoiceValidationService
 from core.po_validation_engine import POValidationService
 from core.po_comparator import POComparator
-from utils.file_utils import save_temp_file, remove_temp_file
 from styles.styles import CSS_STYLE  # Our advanced styling
 
 # Import chatbot functionality from chatbot.py
 from core.chatbot import get_chatbot_response
 
-# Load environment variables: use Streamlit secrets (Cloud) if available; otherwise, load .env locally.
-if "OPENAI_API_KEY" in st.secrets:
-    os.environ["OPENAI_API_KEY"] = st.secrets["OPENAI_API_KEY"]
-else:
-    load_dotenv()
+# Streamlit re-executes this script on every rerun; the services, their validators and
+# the comparator are created once per process and shared by all sessions instead.
+@st.cache_resource
+def get_validation_services():
+    return InvoiceValidationService(), POValidationService()
+
+
+@st.cache_resource
+def get_comparator():
+    return POComparator(temperature=0)
 
-comparator = POComparator(temperature=0)
+
+comparator = get_comparator()
 
 class InvoiceValidationApp:
     def __init__(self, logo_path: str):
         st.set_page_config(layout="wide")
         self.logo_b64 = self.load_logo_as_base64(logo_path)
         self.load_css()
-        self.invoice_service = InvoiceValidationService()
-        self.po_service = POValidationService()
+        self.invoice_service, self.po_service = get_validation_services()
         # Initialize session state to preserve file upload results and chat messages
         if "po_result" not in st.session_state:
             st.session_state["po_result"] = {}
@@ -40,6 +53,10 @@ class InvoiceValidationApp:
             st.session_state["po_record"] = {}
         if "invoice_record" not in st.session_state:
             st.session_state["invoice_record"] = {}
+        if "po_fingerprint" not in st.session_state:
+            st.session_state["po_fingerprint"] = None
+        if "invoice_fingerprint" not in st.session_state:
+            st.session_state["invoice_fingerprint"] = None
         if "messages" not in st.session_state:
             st.session_state["messages"] = []
 
@@ -102,33 +119,47 @@ class InvoiceValidationApp:
             )
             st.markdown('</div>', unsafe_allow_html=True)
 
-        # Process files only when both are uploaded
+        # Process files only when both are uploaded. st.file_uploader keeps its value across
+        # reruns, so a document is only re-validated when its bytes change.
         if uploaded_po and uploaded_invoice:
             st.markdown("<hr>", unsafe_allow_html=True)
-            # Process Purchase Order file
-            po_ext = uploaded_po.name.split(".")[-1].lower()
-            tmp_po_path = save_temp_file(uploaded_po, suffix=f".{po_ext}")
-            try:
-                po_result = self.po_service.validate(tmp_po_path, po_ext)
-            except Exception as e:
-                st.error(f"PO validation failed: {str(e)}")
-                po_result = {}
-            remove_temp_file(tmp_po_path)
-            # Process Invoice file
-            inv_ext = uploaded_invoice.name.split(".")[-1].lower()
-            tmp_inv_path = save_temp_file(uploaded_invoice, suffix=f".{inv_ext}")
-            try:
-                invoice_result = self.invoice_service.validate(tmp_inv_path, inv_ext)
-            except Exception as e:
-                st.error(f"Invoice validation failed: {str(e)}")
-                invoice_result = {}
-            remove_temp_file(tmp_inv_path)
-
-            # Store results in session state for later use by the chatbot
-            st.session_state["po_result"] = po_result
-            st.session_state["invoice_result"] = invoice_result
-            st.session_state["po_record"] = po_result.get("extracted_fields", {})
-            st.session_state["invoice_record"] = invoice_result.get("extracted_fields", {})
+            po_fingerprint = self.upload_fingerprint(uploaded_po)
+            invoice_fingerprint = self.upload_fingerprint(uploaded_invoice)
+            po_changed = po_fingerprint != st.session_state["po_fingerprint"]
+            invoice_changed = invoice_fingerprint != st.session_state["invoice_fingerprint"]
+            if po_changed or invoice_changed:
+                # Validate the PO and the invoice concurrently (straight from the upload buffers);
+                # both spend most of their time waiting on OCR and OpenAI.
+                po_ext = uploaded_po.name.split(".")[-1].lower()
+                inv_ext = uploaded_invoice.name.split(".")[-1].lower()
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    po_future = executor.submit(self.po_service.validate, uploaded_po.getvalue(), po_ext) \
+                        if po_changed else None
+                    invoice_future = executor.submit(self.invoice_service.validate, uploaded_invoice.getvalue(), inv_ext) \
+                        if invoice_changed else None
+                # Errors are reported per document; Streamlit calls stay on the script thread.
+                # A failed document keeps no fingerprint so the next rerun retries it.
+                if po_future is not None:
+                    try:
+                        po_result = po_future.result()
+                    except Exception as e:
+                        st.error(f"PO validation failed: {str(e)}")
+                        po_result = {}
+                    st.session_state["po_fingerprint"] = \
+                        None if self.is_error_result(po_result) else po_fingerprint
+                    # Store results in session state for later use by the chatbot
+                    st.session_state["po_result"] = po_result
+                    st.session_state["po_record"] = po_result.get("extracted_fields", {})
+                if invoice_future is not None:
+                    try:
+                        invoice_result = invoice_future.result()
+                    except Exception as e:
+                        st.error(f"Invoice validation failed: {str(e)}")
+                        invoice_result = {}
+                    st.session_state["invoice_fingerprint"] = \
+                        None if self.is_error_result(invoice_result) else invoice_fingerprint
+                    st.session_state["invoice_result"] = invoice_result
+                    st.session_state["invoice_record"] = invoice_result.get("extracted_fields", {})
 
         # Display uploaded document details if available
         po_result = st.session_state["po_result"]
@@ -162,16 +193,37 @@ class InvoiceValidationApp:
                 with col_inv_right:
                     st.markdown(inv_extracted_html, unsafe_allow_html=True)
             if po_result and invoice_result:
-                discrepancy_report = comparator.compare(
-                    invoice_result.get("extracted_fields", {}),
-                    po_result.get("extracted_fields", {})
-                )
+                invoice_fields = invoice_result.get("extracted_fields", {})
+                po_fields = po_result.get("extracted_fields", {})
+                # The report is rendered locally; the optional LLM summary runs in the background meanwhile
+                narrative_future = comparator.narrate_async(invoice_fields, po_fields) if comparator.narrative else None
+                discrepancy_report = comparator.compare(invoice_fields, po_fields)
                 if discrepancy_report.strip():
                     st.markdown("<hr>", unsafe_allow_html=True)
                     cleaned_discrepancy_report = re.sub(r"```html|```", "", discrepancy_report).strip()
                     st.markdown(self.build_discrepancy_card(cleaned_discrepancy_report), unsafe_allow_html=True)
+                if narrative_future is not None:
+                    try:
+                        with st.spinner("Summarizing discrepancies..."):
+                            st.info(narrative_future.result())
+                    except Exception as e:
+                        st.warning(f"Discrepancy summary unavailable: {str(e)}")
 
 
+    @staticmethod
+    def upload_fingerprint(uploaded_file) -> tuple:
+        """(name, size, sha256) of an uploaded file; equal fingerprints mean the same upload."""
+        data = uploaded_file.getvalue()
+        return uploaded_file.name, len(data), hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def is_error_result(result: dict) -> bool:
+        """
+        True when validation did not complete: validators report errors as anomalies,
+        leaving a corrupted result or one without extracted fields.
+        """
+        return not result or result.get("is_corrupted", False) or not result.get("extracted_fields")
+
     def render_chatbot_page(self):
         st.markdown("<h2>Invoice Chatbot</h2>", unsafe_allow_html=True)
         # Render chat history
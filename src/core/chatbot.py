@@ -9,9 +9,9 @@ from langchain.prompts import (
     SystemMessagePromptTemplate,
     HumanMessagePromptTemplate,
 )
-from langchain_openai import ChatOpenAI
-from utils.vector_stores import invoice_vectorstore, po_vectorstore
+from utils.vector_stores import get_invoice_vectorstore, get_po_vectorstore
 from utils.db import DatabaseManager
+from utils.llm_clients import get_chat_model
 
 def determine_query_type(query: str) -> str:
     """
@@ -134,7 +134,7 @@ def get_chatbot_response(query: str) -> dict:
     print(f"[DEBUG] Extracted PO Number: {po_number}")
 
     # --- Step 2: Optional vector retrieval for context (context used internally only) ---
-    llm = ChatOpenAI(model_name="gpt-4o", temperature=0)
+    llm = get_chat_model("gpt-4o")
     system_msg = SystemMessagePromptTemplate.from_template(
         "You are an expert financial assistant with access to invoice and PO documents. "
         "You are also skilled at drafting email responses based on document details. "
@@ -146,8 +146,8 @@ def get_chatbot_response(query: str) -> dict:
     vector_prompt = ChatPromptTemplate.from_messages([system_msg, human_msg])
     combine_docs_chain = vector_prompt | llm
 
-    invoice_retriever = invoice_vectorstore.as_retriever(search_kwargs={"k": 1})
-    po_retriever = po_vectorstore.as_retriever(search_kwargs={"k": 1})
+    invoice_retriever = get_invoice_vectorstore().as_retriever(search_kwargs={"k": 1})
+    po_retriever = get_po_vectorstore().as_retriever(search_kwargs={"k": 1})
     invoice_chain = create_retrieval_chain(retriever=invoice_retriever, combine_docs_chain=combine_docs_chain)
     po_chain = create_retrieval_chain(retriever=po_retriever, combine_docs_chain=combine_docs_chain)
     # Prime chains (context used internally)
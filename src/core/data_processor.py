@@ -1,9 +1,11 @@
-import pymupdf, fitz
-import pytesseract
 from PIL import Image
 import pandas as pd
-import xml.etree.ElementTree as ET
-from core.file_validator import InvoiceValidator
+from core.file_validator import InvoiceValidator, INVOICE_KEYWORDS, CLASSIFY_PAGES
+from core.field_mapping import build_structured_result, map_csv_fields
+from core.pdf_tables import extract_table_line_items
+from core.xml_extractor import parse_xml
+from utils.file_utils import as_file
+from utils.ocr import extract_pdf_pages, iter_pdf_pages, ocr_image, open_pdf
 import re
 
 class CommonOCRErrors:
@@ -70,21 +72,26 @@ class CommonOCRErrors:
         return text
 
 class PDFValidator(InvoiceValidator):
-    def extract_text(self, file_path):
+    def iter_text(self, source):
+        """Yield PDF text page by page (OCR fixes applied) so non-invoices are rejected early."""
+        try:
+            doc = open_pdf(source)
+            found_text = False
+            for page_text in iter_pdf_pages(doc, keywords=INVOICE_KEYWORDS, first_pages=CLASSIFY_PAGES):
+                page_text = CommonOCRErrors.post_process_ocr_text(page_text)
+                found_text = found_text or bool(page_text.strip())
+                yield page_text
+            if not found_text:
+                yield "No readable text found in PDF."
+        except Exception as e:
+            yield f"Error reading PDF: {str(e)}"
+
+    def extract_text(self, source):
         """Extract text from PDF using PyMuPDF; fallback to OCR if needed."""
         try:
-            doc = pymupdf.open(file_path)
-            text = ""
-            for page in doc:
-                page_text = page.get_text().strip()
-                if page_text:
-                    text += page_text + "\n"
-                else:
-                    # Fallback to OCR
-                    pix = page.get_pixmap(dpi=300)
-                    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                    ocr_text = pytesseract.image_to_string(img)
-                    text += ocr_text + "\n"
+            doc = open_pdf(source)
+            # Text-layer pages are read directly; scanned pages fall back to OCR
+            text = "".join(page_text + "\n" for page_text in extract_pdf_pages(doc, keywords=INVOICE_KEYWORDS))
 
             # Force fixes on the final text
             text = CommonOCRErrors.post_process_ocr_text(text)
@@ -92,31 +99,55 @@ class PDFValidator(InvoiceValidator):
         except Exception as e:
             return f"Error reading PDF: {str(e)}"
 
+    def extract_line_items(self, source):
+        """Read line items from PyMuPDF table detection on text-layer PDFs."""
+        try:
+            return extract_table_line_items(open_pdf(source))
+        except Exception:
+            return None
+
 class CSVValidator(InvoiceValidator):
-    def extract_text(self, file_path):
+    def extract_text(self, source):
         """Extract text from CSV by reading into a DataFrame and converting to string."""
         try:
-            df = pd.read_csv(file_path)
+            df = pd.read_csv(as_file(source))
             return df.to_string()
         except Exception as e:
             return f"Error reading CSV: {str(e)}"
 
+    def extract_structured_fields(self, source):
+        """Map CSV columns (header synonyms, one row per line item) to invoice fields."""
+        try:
+            df = pd.read_csv(as_file(source), dtype=str, keep_default_na=False)
+        except Exception:
+            return None
+        return map_csv_fields(df, self.MANDATORY_FIELDS, self.OPTIONAL_FIELDS)
+
 class XMLValidator(InvoiceValidator):
-    def extract_text(self, file_path):
-        """Extract text from XML by parsing and converting to string."""
+    def extract_text(self, source):
+        """Extract XML as a compact path: value flattening (streamed, no namespaces)."""
         try:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            return ET.tostring(root, encoding='unicode')
+            text, _, _ = parse_xml(as_file(source))
+            return text
         except Exception as e:
             return f"Error reading XML: {str(e)}"
 
+    def extract_structured_fields(self, source):
+        """Map UBL/cXML documents straight to fields; unknown schemas go to the LLM."""
+        try:
+            _, fields, schema = parse_xml(as_file(source))
+        except Exception:
+            return None
+        if schema is None:
+            return None
+        return build_structured_result(fields, self.MANDATORY_FIELDS)
+
 class ImageValidator(InvoiceValidator):
-    def extract_text(self, file_path):
+    def extract_text(self, source):
         """Extract text from image (PNG/JPG) using Tesseract OCR."""
         try:
-            img = Image.open(file_path)
-            raw_text = pytesseract.image_to_string(img)
+            img = Image.open(as_file(source))
+            raw_text = ocr_image(img)
             # Force fixes
             fixed_text = CommonOCRErrors.post_process_ocr_text(raw_text)
             return fixed_text.strip() if fixed_text.strip() else "No readable text found in image."
@@ -0,0 +1,203 @@
+# src/core/doc_classifier.py
+"""
+Local invoice / purchase order / other classifier that gates the LLM call.
+
+A multinomial logistic regression over hashed word unigrams and bigrams,
+trained offline from the examples already in the vector stores and the
+records in invoices.db (plus a small built-in seed set, the only source of
+"other" documents):
+
+    PYTHONPATH=src python -m core.doc_classifier
+
+writes DOC_CLASSIFIER_PATH; validators load it on first use and skip the
+gate while no model has been trained.
+"""
+
+import os
+import re
+import json
+import math
+import random
+import sqlite3
+import threading
+import zlib
+
+from utils.db import DatabaseManager
+from utils.vector_stores import get_vector_store
+
+DOC_CLASSIFIER_PATH = os.getenv("DOC_CLASSIFIER_PATH") or "doc_classifier.json"
+# A document is rejected before the LLM call only when another class wins
+# with at least this probability.
+DOC_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("DOC_CLASSIFIER_MIN_CONFIDENCE") or 0.9)
+
+LABELS = ["invoice", "po", "other"]
+LABEL_NAMES = {"invoice": "an invoice", "po": "a purchase order", "other": "another kind of document"}
+HASH_BUCKETS = 2 ** 18
+# Only the start of a document is scored; the header identifies its type.
+MAX_CHARS = 2000
+
+SEED_DOCUMENTS = [
+    ("invoice", "INVOICE Invoice Number: INV-1001 Invoice Date: 2024-03-01 Due Date: 2024-03-31 Bill To: "
+                "Description Qty Unit Price Amount Subtotal Tax Total Amount Due Please remit payment"),
+    ("invoice", "Tax Invoice No. 5521 Date of issue Payment terms Net 30 Balance due Remit to Supplier VAT"),
+    ("invoice", "Bill Number 8812 Billing period Amount payable Pay by bank transfer Invoice total"),
+    ("po", "PURCHASE ORDER PO Number: PO-2024-017 Order Date: 2024-02-10 Vendor: Ship To: Item Description "
+           "Quantity Unit Cost Total Subtotal Authorized by Buyer"),
+    ("po", "Purchase Order No. 4410 Requisitioner Delivery date Ship via Terms Please supply the following items"),
+    ("po", "Order confirmation request PO # 7781 Deliver to warehouse Buyer approval Order total"),
+    ("other", "Dear Hiring Manager, I am writing to apply for the position. My resume and experience include"),
+    ("other", "Meeting minutes Attendees Agenda Action items Discussion Next meeting scheduled for"),
+    ("other", "Bank statement Account number Opening balance Deposits Withdrawals Closing balance"),
+    ("other", "Packing slip Carton count Shipped items Tracking number Carrier Signature on delivery"),
+    ("other", "Employment contract This agreement is entered into between the employer and the employee"),
+    ("other", "Quarterly report Revenue growth Market overview Outlook Risks Management discussion"),
+    ("other", "Product brochure Features Specifications Warranty Contact our sales team today"),
+    ("other", "Terms and conditions Privacy policy Liability Governing law Termination of service"),
+]
+
+
+def _tokens(text: str) -> list:
+    return re.findall(r"[a-z0-9]+|#", text[:MAX_CHARS].lower())
+
+
+def featurize(text: str) -> dict:
+    """Hashed unigram + bigram counts, log-scaled and L2-normalised: {bucket: weight}."""
+    words = _tokens(text)
+    counts = {}
+    for gram in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        bucket = zlib.crc32(gram.encode("utf-8")) % HASH_BUCKETS
+        counts[bucket] = counts.get(bucket, 0) + 1
+    features = {bucket: 1 + math.log(count) for bucket, count in counts.items()}
+    norm = math.sqrt(sum(v * v for v in features.values())) or 1.0
+    return {bucket: v / norm for bucket, v in features.items()}
+
+
+class DocumentClassifier:
+    """Softmax regression over featurize() vectors; weights are sparse {bucket: weight} dicts per label."""
+
+    def __init__(self, weights: dict = None, bias: dict = None):
+        self.weights = weights or {label: {} for label in LABELS}
+        self.bias = bias or {label: 0.0 for label in LABELS}
+
+    def _probabilities(self, features: dict) -> dict:
+        scores = {
+            label: self.bias[label] + sum(self.weights[label].get(b, 0.0) * v for b, v in features.items())
+            for label in LABELS
+        }
+        top = max(scores.values())
+        exp = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(exp.values())
+        return {label: value / total for label, value in exp.items()}
+
+    def predict_proba(self, text: str) -> dict:
+        return self._probabilities(featurize(text))
+
+    def fit(self, documents: list, epochs: int = 15, learning_rate: float = 0.5, l2: float = 1e-4):
+        """Train on (label, text) pairs with class-balanced SGD."""
+        samples = [(label, featurize(text)) for label, text in documents if text.strip()]
+        counts = {label: sum(1 for l, _ in samples if l == label) for label in LABELS}
+        class_weight = {label: len(samples) / (len(LABELS) * count) if count else 0.0
+                        for label, count in counts.items()}
+        rng = random.Random(0)
+        for epoch in range(epochs):
+            rng.shuffle(samples)
+            rate = learning_rate / (1 + epoch)
+            for label, features in samples:
+                probabilities = self._probabilities(features)
+                for candidate in LABELS:
+                    gradient = (probabilities[candidate] - (1.0 if candidate == label else 0.0)) * class_weight[label]
+                    weights = self.weights[candidate]
+                    for bucket, value in features.items():
+                        weight = weights.get(bucket, 0.0)
+                        weights[bucket] = weight - rate * (gradient * value + l2 * weight)
+                    self.bias[candidate] -= rate * gradient
+        return self
+
+    def save(self, path: str = DOC_CLASSIFIER_PATH):
+        weights = {label: {str(b): round(w, 6) for b, w in ws.items() if abs(w) > 1e-6}
+                   for label, ws in self.weights.items()}
+        with open(path, "w") as f:
+            json.dump({"weights": weights, "bias": self.bias}, f)
+
+    @classmethod
+    def load(cls, path: str = DOC_CLASSIFIER_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        weights = {label: {int(b): w for b, w in ws.items()} for label, ws in data["weights"].items()}
+        return cls(weights, data["bias"])
+
+
+_classifier = None
+_classifier_loaded = False
+_classifier_lock = threading.Lock()
+
+
+def get_document_classifier():
+    """The trained classifier, loaded on first use, or None when none has been trained."""
+    global _classifier, _classifier_loaded
+    with _classifier_lock:
+        if not _classifier_loaded:
+            if os.path.exists(DOC_CLASSIFIER_PATH):
+                _classifier = DocumentClassifier.load(DOC_CLASSIFIER_PATH)
+            _classifier_loaded = True
+        return _classifier
+
+
+def check_document_type(text: str, expected: str):
+    """
+    Returns an anomaly message when the local classifier is confident the text
+    is not of the expected type ("invoice" or "po"), or None to go ahead.
+    """
+    classifier = get_document_classifier()
+    if classifier is None:
+        return None
+    probabilities = classifier.predict_proba(text)
+    label = max(probabilities, key=probabilities.get)
+    if label != expected and probabilities[label] >= DOC_CLASSIFIER_MIN_CONFIDENCE:
+        return (f"Document classified as {LABEL_NAMES[label]} ({probabilities[label]:.0%} confidence), "
+                f"not {LABEL_NAMES[expected]}.")
+    return None
+
+
+def _example_text(document: str) -> str:
+    """The document text part of a stored example chunk (compact or full form)."""
+    match = re.search(r"(?:Text excerpt|Raw (?:Invoice|PO) Text):\n(.*?)\n+Extracted Fields:", document, re.S)
+    return match.group(1) if match else document
+
+
+def _record_text(label: str, fields: dict) -> str:
+    """A stored record rendered as labelled lines, the way documents print their fields."""
+    lines = [f"{'Invoice' if label == 'invoice' else 'Purchase Order'}"]
+    for key, value in fields.items():
+        if key != "line_items" and value not in (None, "", "N/A"):
+            lines.append(f"{key.replace('_', ' ').title()}: {value}")
+    return "\n".join(lines)
+
+
+def load_training_documents() -> list:
+    """(label, text) pairs from the seed set, both vector stores and invoices.db."""
+    documents = list(SEED_DOCUMENTS)
+    for label, store_name in (("invoice", "invoices"), ("po", "purchase_orders")):
+        for document in get_vector_store(store_name).get(include=["documents"])["documents"]:
+            documents.append((label, _example_text(document)))
+
+    DatabaseManager()  # make sure the tables exist
+    conn = sqlite3.connect(DatabaseManager.DB_PATH)
+    for label, table in (("invoice", "invoices"), ("po", "purchase_orders")):
+        for (extracted_fields,) in conn.execute(f"SELECT extracted_fields FROM {table}"):
+            if extracted_fields:
+                documents.append((label, _record_text(label, json.loads(extracted_fields))))
+    conn.close()
+    return documents
+
+
+def main():
+    documents = load_training_documents()
+    classifier = DocumentClassifier().fit(documents)
+    classifier.save(DOC_CLASSIFIER_PATH)
+    counts = {label: sum(1 for l, _ in documents if l == label) for label in LABELS}
+    print(f"Trained on {counts}; saved to {DOC_CLASSIFIER_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# src/core/field_mapping.py
+
+import os
+import re
+
+# Minimum share of mandatory fields that must be mapped from structured data
+# (CSV columns, known XML schemas) before the mapped result is used instead of the LLM.
+MAPPING_MIN_CONFIDENCE = float(os.getenv("MAPPING_MIN_CONFIDENCE") or 0.75)
+
+# Header synonyms for the unified invoice/PO field names.
+FIELD_SYNONYMS = {
+    "invoice_number": ["invoice number", "invoice id", "inv number", "bill number"],
+    "invoice_date": ["invoice date", "date", "issue date", "bill date", "date issued"],
+    "due_date": ["due date", "payment due", "payment due date", "due"],
+    "invoice_to": ["invoice to", "customer", "customer name", "client", "client name", "sold to", "bill to name"],
+    "supplier_name": ["supplier", "supplier name", "vendor", "vendor name", "seller", "seller name"],
+    "billing_address": ["billing address", "bill to", "bill to address", "invoice address"],
+    "shipping_address": ["shipping address", "ship to", "ship to address", "delivery address"],
+    "total_amount": ["total", "total amount", "invoice total", "grand total", "amount due", "balance due"],
+    "discount": ["discount", "discount amount"],
+    "tax_vat": ["tax", "vat", "tax amount", "vat amount", "sales tax", "gst"],
+    "email": ["email", "e mail", "email address"],
+    "phone_number": ["phone", "phone number", "telephone", "tel", "contact number"],
+    "po_number": ["po number", "purchase order", "purchase order number", "order number", "order id"],
+    "po_date": ["po date", "order date", "purchase order date", "date"],
+    "subtotal": ["subtotal", "sub total", "net total", "net amount"],
+    "tax": ["tax", "vat", "tax amount", "sales tax", "gst"],
+    "total": ["total", "total amount", "order total", "grand total", "po total"],
+}
+
+# The field identifying the document. A structured document without it is
+# left to the LLM, which also decides whether it is the expected kind of document.
+DOCUMENT_ID_FIELDS = ["invoice_number", "po_number"]
+
+LINE_ITEM_SYNONYMS = {
+    "description": ["description", "item", "item description", "item name", "product", "product name",
+                    "service", "details"],
+    "quantity": ["quantity", "qty", "units", "quantity ordered", "qty ordered"],
+    "unit_price": ["unit price", "price", "rate", "unit cost", "price per unit", "cost"],
+    "amount": ["amount", "line total", "line amount", "total price", "extended price", "ext price", "total"],
+}
+
+
+def normalize_header(header) -> str:
+    """Lowercase a column header and unify separators and number abbreviations ('Invoice #' -> 'invoice number')."""
+    text = str(header).lower().replace("#", " number ")
+    words = re.sub(r"[^a-z0-9]+", " ", text).split()
+    words = ["number" if word in ("no", "num", "nbr") else word for word in words]
+    return " ".join(words)
+
+
+def synonym_lookup(synonyms: dict, fields: list) -> dict:
+    """Map every normalized synonym (and the field name itself) to its field, for the given fields only."""
+    lookup = {}
+    for field in fields:
+        for name in [field] + synonyms.get(field, []):
+            lookup.setdefault(normalize_header(name), field)
+    return lookup
+
+
+def _is_blank(value) -> bool:
+    return value is None or str(value).strip() == ""
+
+
+def map_csv_fields(df, mandatory_fields: list, optional_fields: list = None):
+    """
+    Map a CSV export straight to the validator's field names.
+
+    Two layouts are recognised:
+      - key/value: two columns whose first column holds field labels;
+      - tabular: one row per line item, header fields in columns whose value
+        is the same on every row (columns that vary are never header fields).
+    Returns a result shaped like the LLM's JSON response
+    ({"validation": {...}, "extracted_fields": {...}}), or None when fewer than
+    MAPPING_MIN_CONFIDENCE of the mandatory fields could be mapped or a header
+    column changes between rows (e.g. an export of several documents).
+    """
+    optional_fields = optional_fields or []
+    header_fields = [f for f in mandatory_fields + optional_fields if f != "line_items"]
+    header_lookup = synonym_lookup(FIELD_SYNONYMS, header_fields)
+    line_lookup = synonym_lookup(LINE_ITEM_SYNONYMS, list(LINE_ITEM_SYNONYMS))
+    extracted = {}
+
+    if df.empty:
+        return None
+
+    # --- key/value layout (without a header row, the first pair is the column names) ---
+    if len(df.columns) == 2:
+        key_column, value_column = df.columns
+        keys = [key_column] + list(df[key_column])
+        values = [value_column] + list(df[value_column])
+        for key, value in zip(keys, values):
+            field = header_lookup.get(normalize_header(key))
+            if field and field not in extracted and not _is_blank(value):
+                extracted[field] = str(value).strip()
+
+    # --- tabular layout ---
+    if len(extracted) < 2:
+        extracted = {}
+        line_columns = {}
+        ambiguous = []  # (column, header field, line field, constant, first value)
+        for column in df.columns:
+            values = [str(v).strip() for v in df[column] if not _is_blank(v)]
+            if not values:
+                continue
+            name = normalize_header(column)
+            header_field = header_lookup.get(name)
+            line_field = line_lookup.get(name)
+            # A document-level value repeats on every row (trivially so in a one-row file)
+            constant = len(set(values)) == 1
+            if header_field in DOCUMENT_ID_FIELDS and not constant:
+                return None  # several documents in one export: left to the LLM
+            if header_field and line_field:
+                ambiguous.append((column, header_field, line_field, constant, values[0]))
+            elif header_field and not constant:
+                return None  # a header field that changes between rows: not a layout we can map
+            elif header_field and header_field not in extracted:
+                extracted[header_field] = values[0]
+            elif line_field and line_field not in line_columns:
+                line_columns[line_field] = column
+
+        # Columns such as "Total" may be a document total or a line total: a value
+        # repeated on every row is the document field, anything else a line field.
+        for column, header_field, line_field, constant, first_value in ambiguous:
+            if constant and header_field not in extracted:
+                extracted[header_field] = first_value
+            elif not constant:
+                if line_field in line_columns:
+                    return None  # varies, but the line field is taken: its meaning is unclear
+                line_columns[line_field] = column
+
+        if "description" in line_columns and ("quantity" in line_columns or "amount" in line_columns):
+            line_items = []
+            for _, row in df.iterrows():
+                item = {}
+                for key in LINE_ITEM_SYNONYMS:
+                    value = row[line_columns[key]] if key in line_columns else ""
+                    item[key] = "N/A" if _is_blank(value) else str(value).strip()
+                if item["description"] != "N/A":
+                    line_items.append(item)
+            if line_items:
+                extracted["line_items"] = line_items
+
+    return build_structured_result(extracted, mandatory_fields)
+
+
+def build_structured_result(extracted: dict, mandatory_fields: list):
+    """
+    Wrap fields mapped from a structured document in the LLM's response shape
+    ({"validation": {...}, "extracted_fields": {...}}), or return None when the
+    document identifier (invoice_number/po_number) was not mapped or fewer than
+    MAPPING_MIN_CONFIDENCE of the mandatory fields were.
+    """
+    if any(f in mandatory_fields and _is_blank(extracted.get(f)) for f in DOCUMENT_ID_FIELDS):
+        return None
+    found = [f for f in mandatory_fields if f in extracted]
+    confidence = len(found) / len(mandatory_fields) if mandatory_fields else 0.0
+    if confidence < MAPPING_MIN_CONFIDENCE:
+        return None
+
+    missing_fields = [f for f in mandatory_fields if f not in extracted]
+    return {
+        "validation": {"valid_format": True, "missing_fields": missing_fields, "anomalies": []},
+        "extracted_fields": extracted,
+    }
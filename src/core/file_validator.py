@@ -1,15 +1,26 @@
 import hashlib
 import json
 from abc import ABC, abstractmethod
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from utils.db import DatabaseManager  
-from utils.vector_stores import invoice_vectorstore  # Import centralized vector store
+from core.doc_classifier import check_document_type
+from utils.db import DatabaseManager
+from utils.llm_clients import get_chat_model, invoke_with_quota
+from utils.file_utils import read_bytes
+from core.rag_context import compact_example, count_tokens, example_metadata, guess_supplier, select_examples
+from utils.vector_stores import get_embeddings, get_vector_store_writer, get_invoice_vectorstore  # Import centralized vector store
 
 INVOICE_KEYWORDS = [
     "invoice", "bill", "supplier", "due", "tax", "vat", "subtotal", "total",
     "line item", "payment", "amount", "qty", "balance", "remit"
 ]
 
+# Number of text-bearing pages read before the keyword check decides whether
+# the rest of a multi-page document is worth extracting.
+CLASSIFY_PAGES = 2
+
+# Bump whenever text extraction or the non-LLM field mapping changes, so
+# validation results cached by an older version are not served again.
+EXTRACTOR_VERSION = "1"
+
 db_manager = DatabaseManager()
 
 class InvoiceValidator(ABC):
@@ -40,10 +51,9 @@ class InvoiceValidator(ABC):
     ]
 
     def __init__(self):
-        self.llm = ChatOpenAI(temperature=0)
-        self.embeddings = OpenAIEmbeddings()
-        # Use the centralized invoice vector store
-        self.vector_store = invoice_vectorstore
+        # Shared, thread-safe clients: one validator instance serves concurrent documents
+        self.llm = get_chat_model()
+        self.embeddings = get_embeddings()
 
         # Updated prompt: Use the same field titles for both Invoice and PO.
         self.base_prompt = (
@@ -75,15 +85,74 @@ class InvoiceValidator(ABC):
             "\"extracted_fields\": { ...all fields above... }\n\n"
             "Your output must be valid JSON only, with no extra text."
         )
+        # Identify what produced a validation result so cached results are
+        # ignored once the prompt or the model changes.
+        self.prompt_hash = hashlib.sha256(self.base_prompt.encode("utf-8")).hexdigest()
+        self.model_version = self.llm.model_name
+
+    @property
+    def vector_store(self):
+        """The shared vector store, opened on first use."""
+        return get_invoice_vectorstore()
 
     @abstractmethod
-    def extract_text(self, file_path):
-        """Extract text from the file (to be implemented by subclasses)."""
+    def extract_text(self, source):
+        """Extract text from a file path or in-memory buffer (to be implemented by subclasses)."""
         pass
 
-    def build_rag_prompt(self, invoice_text, top_k=2):
-        retrieved_docs = self.vector_store.similarity_search(invoice_text, k=top_k)
-        context_snippets = [doc.page_content.strip() for doc in retrieved_docs]
+    def iter_text(self, source):
+        """
+        Yield the document text page by page. Single-page formats yield the whole
+        extract_text() result; multi-page formats override this to extract lazily.
+        """
+        yield self.extract_text(source)
+
+    def extract_structured_fields(self, source):
+        """
+        Map structured documents straight to the output fields without the LLM.
+        Returns a result shaped like the LLM's JSON response, or None to fall back
+        to the LLM (the default; overridden by structured formats such as CSV).
+        """
+        return None
+
+    def extract_line_items(self, source):
+        """
+        Read line items directly from the document layout. Returns
+        (line_items, text_without_line_items), or None to let the LLM extract
+        them (the default; overridden by formats with table geometry such as PDF).
+        """
+        return None
+
+    def read_document(self, source):
+        """
+        Read the document page by page and return (text, recognized).
+        Once CLASSIFY_PAGES pages with text have been read without any INVOICE_KEYWORDS
+        match, reading stops and recognized is False; otherwise the whole
+        document is read and checked.
+        """
+        pages = []
+        text_pages = 0
+        for page_text in self.iter_text(source):
+            if page_text.startswith("Error reading"):
+                return page_text, False
+            pages.append(page_text)
+            if not page_text.strip():
+                continue
+            text_pages += 1
+            if text_pages == CLASSIFY_PAGES:
+                text_lower = "\n".join(pages).lower()
+                if not any(keyword in text_lower for keyword in INVOICE_KEYWORDS):
+                    return "\n".join(pages).strip(), False
+        text = "\n".join(pages).strip()
+        text_lower = text.lower()
+        return text, any(keyword in text_lower for keyword in INVOICE_KEYWORDS)
+
+    def build_rag_prompt(self, invoice_text, top_k=2, line_items_extracted=False, query_embedding=None):
+        # Examples from the same supplier are the most useful; a name match picks the partition
+        supplier = guess_supplier(invoice_text, db_manager.get_supplier_names())
+        context_snippets = select_examples(
+            self.vector_store, invoice_text, top_k=top_k, query_embedding=query_embedding, supplier=supplier
+        )
         context_text = "\n\n".join(context_snippets)
         rag_prompt = (
             f"You have the following validated invoice examples:\n"
@@ -92,19 +161,20 @@ class InvoiceValidator(ABC):
             f"{invoice_text}\n\n"
             f"{self.base_prompt}"
         )
+        if line_items_extracted:
+            rag_prompt += (
+                "\n\nThe line items have already been read from the document's tables and are not "
+                "included in the text above. Return \"line_items\" as an empty array and do not list it as missing."
+            )
         return rag_prompt
 
-    def store_invoice_context(self, invoice_text, extracted_fields):
-        chunk = (
-            "PAST VALIDATED INVOICE EXAMPLE:\n\n"
-            f"Raw Invoice Text:\n{invoice_text}\n\n"
-            "Extracted Fields:\n"
-            f"{json.dumps(extracted_fields, indent=2)}\n"
-        )
-        self.vector_store.add_texts([chunk])
-        self.vector_store.persist()
+    def store_invoice_context(self, invoice_text, extracted_fields, embedding=None):
+        chunk = compact_example("INVOICE", invoice_text, extracted_fields)
+        # Queued and written in batches; see utils.vector_stores.VectorStoreWriter.
+        metadata = example_metadata(invoice_text, extracted_fields, "invoice")
+        get_vector_store_writer("invoices").add(chunk, embedding, metadata)
 
-    def validate_invoice(self, file_path):
+    def validate_invoice(self, source):
         validation_result = {
             "is_valid_format": False,
             "is_corrupted": False,
@@ -114,8 +184,8 @@ class InvoiceValidator(ABC):
             "anomalies": []
         }
         try:
-            with open(file_path, "rb") as f:
-                file_bytes = f.read()
+            # Read once: the same buffer is hashed and parsed
+            file_bytes = read_bytes(source)
             file_hash = hashlib.sha256(file_bytes).hexdigest()
 
             # Check duplicates using dedicated method
@@ -123,38 +193,73 @@ class InvoiceValidator(ABC):
                 validation_result["is_duplicate"] = True
                 validation_result["anomalies"].append("Duplicate invoice detected.")
 
-            invoice_text = self.extract_text(file_path)
+            # A previously validated copy of this exact file: reuse its result
+            cached_result = db_manager.get_cached_validation(
+                file_hash, "invoice", EXTRACTOR_VERSION, self.prompt_hash, self.model_version
+            )
+            if cached_result is not None:
+                cached_result["is_duplicate"] = cached_result["is_duplicate"] or validation_result["is_duplicate"]
+                return cached_result
+
+            invoice_text, recognized = self.read_document(file_bytes)
             if not invoice_text or invoice_text.startswith("Error reading"):
                 validation_result["is_corrupted"] = True
                 validation_result["anomalies"].append("File extraction error: " + invoice_text)
                 return validation_result
 
-            text_lower = invoice_text.lower()
-            if not any(keyword in text_lower for keyword in INVOICE_KEYWORDS):
+            if not recognized:
                 validation_result["anomalies"].append("Document not recognized as invoice (keyword check).")
                 return validation_result
 
+            # The local classifier rejects other document types before any network call
+            rejection = check_document_type(invoice_text, "invoice")
+            if rejection:
+                validation_result["anomalies"].append(rejection)
+                return validation_result
+
+            # Embed the document once: the vector serves the duplicate check, retrieval and storage
+            query_embedding = None
             try:
-                results = self.vector_store.similarity_search_with_score(invoice_text, k=1)
+                query_embedding = self.vector_store.embeddings.embed_query(invoice_text)
+                results = self.vector_store.similarity_search_by_vector_with_relevance_scores(query_embedding, k=1)
                 if results and results[0][1] < 0.2:
                     validation_result["is_duplicate"] = True
             except Exception as e:
                 validation_result["anomalies"].append(f"Vector search error: {str(e)}")
 
-            prompt_text = self.build_rag_prompt(invoice_text, top_k=2)
-            llm_response = self.llm.invoke(prompt_text)
-            raw_text = llm_response.content if hasattr(llm_response, "content") else str(llm_response)
-            start_index = raw_text.find('{')
-            end_index = raw_text.rfind('}') + 1
-            json_str = raw_text[start_index:end_index] if start_index != -1 and end_index != -1 else raw_text
+            # Well-formed structured exports are mapped directly; the LLM is the fallback
+            parsed_result = self.extract_structured_fields(file_bytes)
+            table_line_items = None
+            if parsed_result is None:
+                # Line items read from table geometry keep them out of the prompt and the response
+                table = self.extract_line_items(file_bytes)
+                if table is not None:
+                    table_line_items, header_text = table
+                    prompt_text = self.build_rag_prompt(
+                        header_text, top_k=2, line_items_extracted=True, query_embedding=query_embedding
+                    )
+                else:
+                    prompt_text = self.build_rag_prompt(invoice_text, top_k=2, query_embedding=query_embedding)
+                llm_response = invoke_with_quota(self.llm, prompt_text, count_tokens(prompt_text))
+                raw_text = llm_response.content if hasattr(llm_response, "content") else str(llm_response)
+                start_index = raw_text.find('{')
+                end_index = raw_text.rfind('}') + 1
+                json_str = raw_text[start_index:end_index] if start_index != -1 and end_index != -1 else raw_text
 
+            cacheable = False
             try:
-                parsed_result = json.loads(json_str)
+                if parsed_result is None:
+                    parsed_result = json.loads(json_str)
                 val = parsed_result.get("validation", {})
                 validation_result["is_valid_format"] = val.get("valid_format", False)
                 validation_result["missing_fields"] = val.get("missing_fields", [])
                 validation_result["anomalies"] = val.get("anomalies", [])
                 extracted = parsed_result.get("extracted_fields", {})
+                if table_line_items:
+                    extracted["line_items"] = table_line_items
+                    validation_result["missing_fields"] = [
+                        f for f in validation_result["missing_fields"] if f != "line_items"
+                    ]
 
                 final_fields = {}
                 for field in self.MANDATORY_FIELDS:
@@ -163,17 +268,27 @@ class InvoiceValidator(ABC):
                     if field in extracted:
                         final_fields[field] = extracted[field]
                 validation_result["extracted_fields"] = final_fields
+                cacheable = True
 
             except Exception as parse_error:
                 validation_result["anomalies"].append(f"Failed to parse JSON: {str(parse_error)}")
 
-            if validation_result["is_valid_format"]:
+            # Duplicates are neither stored again nor added as another example
+            if validation_result["is_valid_format"] and not validation_result["is_duplicate"]:
                 try:
-                    self.store_invoice_context(invoice_text, validation_result["extracted_fields"])
-                    if not validation_result["is_duplicate"]:
-                        db_manager.store_invoice(file_hash, validation_result["extracted_fields"])
+                    self.store_invoice_context(invoice_text, validation_result["extracted_fields"], query_embedding)
+                    db_manager.store_invoice(file_hash, validation_result["extracted_fields"])
                 except Exception as e:
                     validation_result["anomalies"].append(f"Failed to store invoice in DB: {str(e)}")
+                    cacheable = False
+
+            if cacheable:
+                try:
+                    db_manager.store_cached_validation(
+                        file_hash, "invoice", EXTRACTOR_VERSION, self.prompt_hash, self.model_version, validation_result
+                    )
+                except Exception as e:
+                    validation_result["anomalies"].append(f"Failed to cache validation result: {str(e)}")
         except Exception as e:
             validation_result["anomalies"].append(str(e))
         return validation_result
@@ -0,0 +1,102 @@
+# src/core/pdf_tables.py
+
+from core.field_mapping import LINE_ITEM_SYNONYMS, synonym_lookup, normalize_header
+
+# Rows whose description is one of these are table footers, not line items.
+SUMMARY_ROW_LABELS = {"subtotal", "sub total", "total", "grand total", "tax", "vat", "discount",
+                      "shipping", "balance due", "amount due"}
+
+
+def _map_header(names: list) -> dict:
+    """Map line item keys to column indexes for a table header, e.g. {"description": 0, "quantity": 1}."""
+    lookup = synonym_lookup(LINE_ITEM_SYNONYMS, list(LINE_ITEM_SYNONYMS))
+    columns = {}
+    for index, name in enumerate(names):
+        key = lookup.get(normalize_header(name or ""))
+        if key and key not in columns:
+            columns[key] = index
+    return columns
+
+
+def _table_line_items(table):
+    """
+    (line_items, summary_lines) of one detected table, or ([], []) if its header
+    does not look like a line item table. Summary rows (Subtotal, Tax, Total, ...)
+    are returned as text lines so header fields such as the total stay visible.
+    """
+    rows = table.extract()
+    if not rows:
+        return [], []
+    header = table.header
+    names = header.names if header is not None else rows[0]
+    columns = _map_header(names)
+    if "description" not in columns or not ("quantity" in columns or "amount" in columns):
+        return [], []
+    if header is None or not header.external:
+        rows = rows[1:]
+
+    line_items = []
+    summary_lines = []
+    for row in rows:
+        item = {}
+        for key in LINE_ITEM_SYNONYMS:
+            value = row[columns[key]] if key in columns and columns[key] < len(row) else None
+            value = " ".join(str(value).split()) if value is not None else ""
+            item[key] = value or "N/A"
+        description = item["description"]
+        if normalize_header(description) in SUMMARY_ROW_LABELS or (description == "N/A" and any(row)):
+            cells = [" ".join(str(cell).split()) for cell in row if cell is not None and str(cell).strip()]
+            if cells:
+                summary_lines.append(" ".join(cells))
+            continue
+        line_items.append(item)
+    return line_items, summary_lines
+
+
+def _inside(word, bbox) -> bool:
+    x_center = (word[0] + word[2]) / 2
+    y_center = (word[1] + word[3]) / 2
+    return bbox[0] <= x_center <= bbox[2] and bbox[1] <= y_center <= bbox[3]
+
+
+def extract_table_line_items(doc):
+    """
+    Detect line item tables on the text-layer pages of an open PyMuPDF document.
+
+    Returns (line_items, text_outside_tables): line items are
+    {description, quantity, unit_price, amount} dicts read from the table
+    cells, and the text is every page's words that fall outside those tables
+    plus the tables' summary rows (so the LLM only sees header fields, totals
+    included). Returns None when no line item table was found.
+    """
+    line_items = []
+    page_texts = []
+    for page in doc:
+        words = page.get_text("words")
+        if not words:
+            return None  # scanned page: no geometry to work with
+        table_boxes = []
+        summary_lines = []
+        for table in page.find_tables().tables:
+            items, summary = _table_line_items(table)
+            if items:
+                line_items.extend(items)
+                summary_lines.extend(summary)
+                table_boxes.append(table.bbox)
+
+        lines = []
+        current_line = None
+        for word in words:
+            if any(_inside(word, bbox) for bbox in table_boxes):
+                continue
+            line_key = (word[5], word[6])  # (block number, line number)
+            if line_key != current_line:
+                lines.append(word[4])
+                current_line = line_key
+            else:
+                lines[-1] += " " + word[4]
+        page_texts.append("\n".join(lines + summary_lines))
+
+    if not line_items:
+        return None
+    return line_items, "\n".join(page_texts).strip()
@@ -1,11 +1,60 @@
 # src/core/po_comparator.py
 
-from langchain_openai import ChatOpenAI
+import os
+import html
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.rag_context import count_tokens
+from utils.cache import SQLiteCache
+from utils.llm_clients import get_chat_model, invoke_with_quota
+
+# Add a short LLM-written summary under the locally rendered report (off by default).
+REPORT_NARRATIVE = os.getenv("REPORT_NARRATIVE", "").lower() in ("1", "true", "yes")
+
+# Bump whenever build_comparison()/render_report()/the narrative prompt change,
+# so reports cached by an older version are not served again.
+COMPARATOR_VERSION = "2"
+# Reports (and narratives) are memoized per invoice/PO pair, shared by every
+# session and process using the same file.
+REPORT_CACHE_PATH = os.getenv("REPORT_CACHE_PATH") or "report_cache.db"
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES") or 1000)
+
+LINE_ITEM_PROPERTIES = [("quantity", "Quantity"), ("unit_price", "Unit Price"), ("amount", "Line Item Amount")]
+
+_narrative_executor = ThreadPoolExecutor(max_workers=2)
+
+_report_cache = None
+_report_cache_lock = threading.Lock()
+
+
+def get_report_cache() -> SQLiteCache:
+    """Returns the process-wide discrepancy report cache."""
+    global _report_cache
+    with _report_cache_lock:
+        if _report_cache is None:
+            _report_cache = SQLiteCache(REPORT_CACHE_PATH, max_entries=REPORT_CACHE_MAX_ENTRIES)
+        return _report_cache
+
+
+def comparison_key(invoice_fields: dict, po_fields: dict) -> str:
+    """Content hash of an invoice/PO pair and the comparator version."""
+    payload = json.dumps({"invoice": invoice_fields, "po": po_fields}, sort_keys=True, default=str)
+    return hashlib.sha256(f"{COMPARATOR_VERSION}:{payload}".encode("utf-8")).hexdigest()
+
 
 class POComparator:
-    def __init__(self, temperature: float = 0):
-        self.llm = ChatOpenAI(model_name="gpt-4o", temperature=temperature)
-    
+    # Instances built without __init__ (e.g. in tests) skip the report cache
+    report_cache = None
+
+    def __init__(self, temperature: float = 0, narrative: bool = REPORT_NARRATIVE):
+        self.llm = get_chat_model("gpt-4o", temperature)
+        self.narrative = narrative
+        self.temperature = temperature
+        self.report_cache = get_report_cache()
+
     @staticmethod
     def parse_amount(amount_str: str) -> float:
         """Converts a string like '$1,899.00' to a float value."""
@@ -21,104 +70,185 @@ class POComparator:
         """
         return item.get("description", "").strip().upper()
 
-    def build_raw_analysis(self, invoice_fields: dict, po_fields: dict) -> str:
-        raw_lines = []
-    
-        # --- Overall Extracted Details ---
-        inv_id = invoice_fields.get("invoice_number", "N/A")
-        supplier = invoice_fields.get("supplier_name", "N/A")
-        po_number = po_fields.get("po_number", "N/A")
+    @staticmethod
+    def _is_missing(value) -> bool:
+        return str(value).strip().upper() in ("", "N/A")
+
+    def build_comparison(self, invoice_fields: dict, po_fields: dict) -> dict:
+        """
+        Compare an invoice with its purchase order. Returns
+          - details: (label, value) pairs describing the documents;
+          - discrepancies: {"message", "severity", "next_step"} dicts, severity
+            "review" for real mismatches and "info" when a value is only on one side;
+          - line_items: {"item", "missing_in", "properties": [(label, invoice, po, match)]} dicts.
+        """
         inv_total = self.parse_amount(invoice_fields.get("total_amount", "0"))
         po_total = self.parse_amount(po_fields.get("total", "0"))
-        inv_bill = invoice_fields.get("billing_address", "N/A")
-        po_bill = po_fields.get("billing_address", "N/A")
-        inv_ship = invoice_fields.get("shipping_address", "N/A")
-        po_ship = po_fields.get("shipping_address", "N/A")
-    
-        raw_lines.append("=== Overall Extracted Details ===")
-        raw_lines.append(f"Invoice ID: {inv_id}")
-        raw_lines.append(f"Supplier: {supplier}")
-        raw_lines.append(f"PO Number: {po_number}")
-        raw_lines.append(f"Invoice Amount: ${inv_total:.2f}")
-        raw_lines.append(f"PO Amount: ${po_total:.2f}")
-        raw_lines.append(f"Billing Address: Invoice: {inv_bill} | PO: {po_bill}")
-        raw_lines.append(f"Shipping Address: Invoice: {inv_ship} | PO: {po_ship}")
-        raw_lines.append("")
-    
-        # --- Raw Discrepancy Analysis ---
-        raw_lines.append("=== Raw Discrepancy Analysis ===")
+        details = [
+            ("Invoice ID", invoice_fields.get("invoice_number", "N/A")),
+            ("Supplier", invoice_fields.get("supplier_name", "N/A")),
+            ("PO Number", po_fields.get("po_number", "N/A")),
+            ("Invoice Amount", f"${inv_total:.2f}"),
+            ("PO Amount", f"${po_total:.2f}"),
+        ]
+
+        discrepancies = []
         if inv_total != po_total:
-            raw_lines.append(f"Total Discrepancy: Invoice total ${inv_total:.2f} vs PO total ${po_total:.2f}")
-        
-        # If both addresses exist but differ, note a discrepancy. 
-        # If invoice address is "N/A" but PO has an address, or vice versa, treat it as a "missing" scenario.
-        if inv_bill.lower() != po_bill.lower():
-            raw_lines.append(f"Billing Address Discrepancy: Invoice '{inv_bill}' vs PO '{po_bill}'")
-        if inv_ship.lower() != po_ship.lower():
-            raw_lines.append(f"Shipping Address Discrepancy: Invoice '{inv_ship}' vs PO '{po_ship}'")
-    
-        # --- Detailed Line Item Comparison ---
-        raw_lines.append("")
-        raw_lines.append("=== Detailed Line Item Comparison ===")
-        inv_items = invoice_fields.get("line_items", [])
-        po_items = po_fields.get("line_items", [])
-    
-        inv_dict = {self.get_item_key(item): item for item in inv_items if self.get_item_key(item)}
-        po_dict = {self.get_item_key(item): item for item in po_items if self.get_item_key(item)}
-        all_keys = set(inv_dict.keys()) | set(po_dict.keys())
-    
-        for key in sorted(all_keys):
+            discrepancies.append({
+                "message": f"Total Discrepancy: Invoice total ${inv_total:.2f} vs PO total ${po_total:.2f}",
+                "severity": "review",
+                "next_step": "Confirm the invoiced total with the supplier before approving payment.",
+            })
+
+        for field, label in (("billing_address", "Billing Address"), ("shipping_address", "Shipping Address")):
+            inv_value = invoice_fields.get(field, "N/A")
+            po_value = po_fields.get(field, "N/A")
+            details.append((label, f"Invoice: {inv_value} | PO: {po_value}"))
+            if str(inv_value).lower() == str(po_value).lower():
+                continue
+            # An address printed on only one document is noted, not flagged
+            one_sided = self._is_missing(inv_value) or self._is_missing(po_value)
+            discrepancies.append({
+                "message": f"{label} Discrepancy: Invoice '{inv_value}' vs PO '{po_value}'",
+                "severity": "info" if one_sided else "review",
+                "next_step": None if one_sided else f"Verify the {label.lower()} with the supplier.",
+            })
+
+        inv_dict = {self.get_item_key(item): item for item in invoice_fields.get("line_items", []) if self.get_item_key(item)}
+        po_dict = {self.get_item_key(item): item for item in po_fields.get("line_items", []) if self.get_item_key(item)}
+        line_items = []
+        for key in sorted(set(inv_dict) | set(po_dict)):
             inv_item = inv_dict.get(key)
             po_item = po_dict.get(key)
-            raw_lines.append(f"Item: {key}")
-            properties = [("quantity", "Quantity"), ("unit_price", "Unit Price"), ("amount", "Line Item Amount")]
-            for prop_key, prop_label in properties:
+            properties = []
+            for prop_key, prop_label in LINE_ITEM_PROPERTIES:
                 inv_val = inv_item.get(prop_key, "N/A") if inv_item else "N/A"
                 po_val = po_item.get(prop_key, "N/A") if po_item else "N/A"
-                status = "Match" if str(inv_val).strip() == str(po_val).strip() else "Mismatch"
-                raw_lines.append(f"  {prop_label}: Invoice = {inv_val} | PO = {po_val} => {status}")
-            if not inv_item:
-                raw_lines.append("  --> Missing in Invoice")
-            if not po_item:
-                raw_lines.append("  --> Missing in PO")
+                properties.append((prop_label, inv_val, po_val, str(inv_val).strip() == str(po_val).strip()))
+            missing_in = "Invoice" if not inv_item else "PO" if not po_item else None
+            line_items.append({"item": key, "missing_in": missing_in, "properties": properties})
+
+            if missing_in:
+                discrepancies.append({
+                    "message": f"Line item '{key}' is missing in the {missing_in}",
+                    "severity": "review",
+                    "next_step": f"Check whether '{key}' was ordered and delivered.",
+                })
+            else:
+                mismatched = [label for label, _, _, match in properties if not match]
+                if mismatched:
+                    discrepancies.append({
+                        "message": f"Line item '{key}': {', '.join(mismatched)} mismatch",
+                        "severity": "review",
+                        "next_step": f"Reconcile {', '.join(m.lower() for m in mismatched)} for '{key}'.",
+                    })
+
+        return {"details": details, "discrepancies": discrepancies, "line_items": line_items}
+
+    def build_raw_analysis(self, invoice_fields: dict, po_fields: dict) -> str:
+        """Plain-text form of build_comparison(), as given to the narrative prompt."""
+        comparison = self.build_comparison(invoice_fields, po_fields)
+        raw_lines = ["=== Overall Extracted Details ==="]
+        raw_lines += [f"{label}: {value}" for label, value in comparison["details"]]
+        raw_lines += ["", "=== Raw Discrepancy Analysis ==="]
+        raw_lines += [d["message"] for d in comparison["discrepancies"]]
+        raw_lines += ["", "=== Detailed Line Item Comparison ==="]
+        for row in comparison["line_items"]:
+            raw_lines.append(f"Item: {row['item']}")
+            for label, inv_val, po_val, match in row["properties"]:
+                raw_lines.append(f"  {label}: Invoice = {inv_val} | PO = {po_val} => {'Match' if match else 'Mismatch'}")
+            if row["missing_in"]:
+                raw_lines.append(f"  --> Missing in {row['missing_in']}")
             raw_lines.append("")
-    
         return "\n".join(raw_lines)
 
-    def build_prompt(self, raw_analysis: str) -> str:
+    def render_report(self, comparison: dict, narrative: str = None) -> str:
         """
-        Construct a detailed prompt instructing the LLM to generate a final discrepancy report in HTML.
-        We explicitly restrict it to minimal tags so that we don't see raw <div> tags in the final output.
+        Render the discrepancy report as HTML (Validation Status, Invoice Details,
+        Discrepancy Found, Next Steps, Detailed Breakdown) using only h2/h3/p/ul/li/table tags.
         """
-        prompt = (
-            "You are an expert in financial discrepancy analysis. Analyze the following raw discrepancy analysis "
-            "between an Invoice and a Purchase Order. Generate a final discrepancy report in HTML format that "
-            "when rendered, does not show raw HTML tags like <div>. Instead, use only these tags:\n\n"
-            "- <h2>, <h3>, <p>, <ul>, <li>, <table>, <thead>, <tbody>, <tr>, <th>, <td>\n\n"
-            "Your final report must include:\n\n"
-            "1. <h2>Validation Status</h2>: A concise statement indicating documents are flagged for review.\n"
-            "2. <h2>Invoice Details</h2>: A bullet list (<ul>) summarizing key invoice details (Invoice ID, Supplier, PO Number, etc.).\n"
-            "3. <h2>Discrepancy Found</h2>: A bullet list of identified discrepancies.\n"
-            "4. <h2>Next Steps</h2>: Actionable recommendations.\n"
-            "5. <h2>Detailed Breakdown</h2>: For each line item, create an HTML table (<table>) with columns for Description, Invoice value, PO value, and match status (match or mistmatch).\n\n"
-            "Important: If one document has an address while the other does not, do not automatically treat it as a severe discrepancy unless it's truly required. "
-            "Use your best judgment. The final HTML must not contain <div> or extraneous tags.\n\n"
-            "Below is the raw discrepancy analysis:\n"
-            "----------------------------------------\n"
-            f"{raw_analysis.replace(chr(10), '<br>')}\n"
-            "----------------------------------------\n\n"
-            "Final Report (HTML) using only <h2>, <h3>, <p>, <ul>, <li>, <table>, <thead>, <tbody>, <tr>, <th>, <td>:"
+        esc = lambda value: html.escape(str(value))
+        review = [d for d in comparison["discrepancies"] if d["severity"] == "review"]
+        parts = ["<h2>Validation Status</h2>"]
+        if review:
+            parts.append(f"<p>Flagged for review: {len(review)} discrepanc{'y' if len(review) == 1 else 'ies'} "
+                         "between the invoice and the purchase order.</p>")
+        else:
+            parts.append("<p>The invoice matches the purchase order.</p>")
+        if narrative:
+            parts.append(f"<p>{esc(narrative)}</p>")
+
+        parts.append("<h2>Invoice Details</h2><ul>")
+        parts += [f"<li>{esc(label)}: {esc(value)}</li>" for label, value in comparison["details"]]
+        parts.append("</ul>")
+
+        parts.append("<h2>Discrepancy Found</h2>")
+        if comparison["discrepancies"]:
+            parts.append("<ul>")
+            for d in comparison["discrepancies"]:
+                note = " (noted only: present on one document)" if d["severity"] == "info" else ""
+                parts.append(f"<li>{esc(d['message'])}{note}</li>")
+            parts.append("</ul>")
+        else:
+            parts.append("<p>No discrepancies found.</p>")
+
+        parts.append("<h2>Next Steps</h2><ul>")
+        steps = list(dict.fromkeys(d["next_step"] for d in review if d["next_step"]))
+        if not steps:
+            steps = ["No action needed; the invoice can proceed to approval."]
+        parts += [f"<li>{esc(step)}</li>" for step in steps]
+        parts.append("</ul>")
+
+        parts.append("<h2>Detailed Breakdown</h2>")
+        if not comparison["line_items"]:
+            parts.append("<p>No line items to compare.</p>")
+        for row in comparison["line_items"]:
+            title = esc(row["item"]) + (f" (missing in {esc(row['missing_in'])})" if row["missing_in"] else "")
+            parts.append(f"<h3>{title}</h3><table><thead><tr><th>Description</th><th>Invoice</th><th>PO</th>"
+                         "<th>Status</th></tr></thead><tbody>")
+            for label, inv_val, po_val, match in row["properties"]:
+                parts.append(f"<tr><td>{esc(label)}</td><td>{esc(inv_val)}</td><td>{esc(po_val)}</td>"
+                             f"<td>{'Match' if match else 'Mismatch'}</td></tr>")
+            parts.append("</tbody></table>")
+        return "\n".join(parts)
+
+    def build_narrative_prompt(self, raw_analysis: str) -> str:
+        return (
+            "You are an expert in financial discrepancy analysis. In at most three sentences of plain text "
+            "(no HTML, no lists), summarise for an accounts payable clerk how this invoice compares with its "
+            "purchase order and what matters most. If one document has an address while the other does not, "
+            "do not treat it as a severe discrepancy.\n\n"
+            f"{raw_analysis}"
         )
-        return prompt
+
+    def narrate(self, invoice_fields: dict, po_fields: dict) -> str:
+        """Short LLM-written summary of the comparison, memoized for temperature 0."""
+        cache = self.report_cache if self.temperature == 0 else None
+        key = f"narrative:{self.llm.model_name}:{comparison_key(invoice_fields, po_fields)}"
+        narrative = cache.get(key) if cache else None
+        if narrative is not None:
+            return narrative
+        prompt = self.build_narrative_prompt(self.build_raw_analysis(invoice_fields, po_fields))
+        llm_response = invoke_with_quota(self.llm, prompt, count_tokens(prompt))
+        narrative = (llm_response.content if hasattr(llm_response, "content") else str(llm_response)).strip()
+        if cache:
+            cache.set(key, narrative)
+        return narrative
+
+    def narrate_async(self, invoice_fields: dict, po_fields: dict):
+        """Start narrate() in the background and return its Future."""
+        return _narrative_executor.submit(self.narrate, invoice_fields, po_fields)
 
     def compare(self, invoice_fields: dict, po_fields: dict) -> str:
         """
-        Generate the final discrepancy report by building a raw analysis, constructing the prompt,
-        invoking the LLM, and returning the final HTML
-          report.
+        Generate the final discrepancy report as HTML, rendered locally from the
+        structured comparison (no LLM call) and memoized per invoice/PO pair.
+        The optional narrative is requested separately with narrate()/narrate_async().
         """
-        raw_analysis = self.build_raw_analysis(invoice_fields, po_fields)
-        prompt = self.build_prompt(raw_analysis)
-        llm_response = self.llm.invoke(prompt)
-        final_report = llm_response.content if hasattr(llm_response, "content") else str(llm_response)
-        return final_report
+        key = f"report:{comparison_key(invoice_fields, po_fields)}"
+        report = self.report_cache.get(key) if self.report_cache else None
+        if report is None:
+            report = self.render_report(self.build_comparison(invoice_fields, po_fields))
+            if self.report_cache:
+                self.report_cache.set(key, report)
+        return report
@@ -1,5 +1,8 @@
 # src/core/po_validation_engine.py
+import os
+import threading
 from core.po_validator import PDFPOValidator, CSVPOValidator, XMLPOValidator, ImagePOValidator
+from utils.concurrency import map_concurrently
 
 class POValidationService:
     """
@@ -15,11 +18,53 @@ class POValidationService:
             "jpg": ImagePOValidator,
             "jpeg": ImagePOValidator
         }
-    
-    def validate(self, file_path: str, file_ext: str):
+        # One validator per class, created on first use and reused for every
+        # document: validators keep no per-document state and share the
+        # process-wide LLM and embedding clients, so they are safe across threads.
+        self._instances = {}
+        self._instances_lock = threading.Lock()
+
+    def get_validator(self, file_ext: str):
+        """Returns the shared validator instance for a file extension."""
         file_ext = file_ext.lower()
         validator_class = self.validators.get(file_ext)
         if not validator_class:
             raise ValueError(f"Unsupported PO file format: {file_ext}")
-        validator = validator_class()
-        return validator.validate_po(file_path)
+        with self._instances_lock:
+            validator = self._instances.get(validator_class)
+            if validator is None:
+                validator = validator_class()
+                self._instances[validator_class] = validator
+            return validator
+
+    def validate(self, source, file_ext: str):
+        """Validate a document given as a file path or an in-memory bytes/memoryview buffer."""
+        return self.get_validator(file_ext).validate_po(source)
+
+    def validate_many(self, sources, max_workers: int = None, ordered: bool = True):
+        """
+        Validate many documents concurrently. sources holds file paths (the
+        format comes from the extension) or (source, file_ext) pairs.
+        At most max_workers documents (default VALIDATION_CONCURRENCY) are in
+        flight, so extraction, embedding and LLM calls of different documents
+        overlap; LLM calls share the process-wide OpenAI rate limiter.
+        ordered=True returns the results in input order; ordered=False returns
+        an iterator of (input index, result) pairs as documents finish.
+        A document that cannot be validated gets a result whose anomalies
+        explain why, instead of failing the batch.
+        """
+        return map_concurrently(self._validate_one, sources, max_workers=max_workers, ordered=ordered)
+
+    def _validate_one(self, item):
+        source, file_ext = item if isinstance(item, tuple) else (item, os.path.splitext(str(item))[1].lstrip("."))
+        try:
+            return self.validate(source, file_ext)
+        except Exception as e:
+            return {
+                "is_valid_format": False,
+                "is_corrupted": False,
+                "is_duplicate": False,
+                "missing_fields": [],
+                "extracted_fields": {},
+                "anomalies": [f"Validation failed: {str(e)}"]
+            }
@@ -1,21 +1,33 @@
 import re
 import json, hashlib
 from abc import ABC, abstractmethod
-import pymupdf, fitz
-import pytesseract
 from PIL import Image
 import pandas as pd
-import xml.etree.ElementTree as ET
 from core.data_processor import CommonOCRErrors  # Reuse post-processing if needed
+from core.field_mapping import build_structured_result, map_csv_fields
+from core.pdf_tables import extract_table_line_items
+from core.xml_extractor import parse_xml
+from core.doc_classifier import check_document_type
 from utils.db import DatabaseManager
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from utils.vector_stores import po_vectorstore  # Import the centralized PO vector store
+from utils.llm_clients import get_chat_model, invoke_with_quota
+from utils.file_utils import as_file, read_bytes
+from utils.ocr import extract_pdf_pages, iter_pdf_pages, ocr_image, open_pdf
+from core.rag_context import compact_example, count_tokens, example_metadata, guess_supplier, select_examples
+from utils.vector_stores import get_embeddings, get_vector_store_writer, get_po_vectorstore  # Import the centralized PO vector store
 
 PO_KEYWORDS = [
     "purchase order", "po number", "vendor", "shipping address", "billing address",
     "order summary", "subtotal", "tax", "total"
 ]
 
+# Number of text-bearing pages read before the keyword check decides whether
+# the rest of a multi-page document is worth extracting.
+CLASSIFY_PAGES = 2
+
+# Bump whenever text extraction or the non-LLM field mapping changes, so
+# validation results cached by an older version are not served again.
+EXTRACTOR_VERSION = "1"
+
 db_manager = DatabaseManager()
 
 class POValidator(ABC):
@@ -37,10 +49,9 @@ class POValidator(ABC):
     ]
     
     def __init__(self):
-        self.llm = ChatOpenAI(temperature=0)
-        self.embeddings = OpenAIEmbeddings()
-        # Use the centralized vector store for purchase orders.
-        self.vector_store = po_vectorstore
+        # Shared, thread-safe clients: one validator instance serves concurrent documents
+        self.llm = get_chat_model()
+        self.embeddings = get_embeddings()
         self.base_prompt = (
             "First, determine if this text is actually a purchase order. If not, respond with:\n\n"
             "{\n"
@@ -66,15 +77,74 @@ class POValidator(ABC):
             "\"extracted_fields\": { ...all fields above... }\n\n"
             "Your output must be valid JSON only, with no extra text."
         )
+        # Identify what produced a validation result so cached results are
+        # ignored once the prompt or the model changes.
+        self.prompt_hash = hashlib.sha256(self.base_prompt.encode("utf-8")).hexdigest()
+        self.model_version = self.llm.model_name
     
+    @property
+    def vector_store(self):
+        """The shared vector store, opened on first use."""
+        return get_po_vectorstore()
+
     @abstractmethod
-    def extract_text(self, file_path: str) -> str:
-        """Extract text from the file (to be implemented by subclasses)."""
+    def extract_text(self, source) -> str:
+        """Extract text from a file path or in-memory buffer (to be implemented by subclasses)."""
         pass
 
-    def build_rag_prompt(self, po_text, top_k=2):
-        retrieved_docs = self.vector_store.similarity_search(po_text, k=top_k)
-        context_snippets = [doc.page_content.strip() for doc in retrieved_docs]
+    def iter_text(self, source):
+        """
+        Yield the document text page by page. Single-page formats yield the whole
+        extract_text() result; multi-page formats override this to extract lazily.
+        """
+        yield self.extract_text(source)
+
+    def extract_structured_fields(self, source):
+        """
+        Map structured documents straight to the output fields without the LLM.
+        Returns a result shaped like the LLM's JSON response, or None to fall back
+        to the LLM (the default; overridden by structured formats such as CSV).
+        """
+        return None
+
+    def extract_line_items(self, source):
+        """
+        Read line items directly from the document layout. Returns
+        (line_items, text_without_line_items), or None to let the LLM extract
+        them (the default; overridden by formats with table geometry such as PDF).
+        """
+        return None
+
+    def read_document(self, source):
+        """
+        Read the document page by page and return (text, recognized).
+        Once CLASSIFY_PAGES pages with text have been read without any PO_KEYWORDS
+        match, reading stops and recognized is False; otherwise the whole
+        document is read and checked.
+        """
+        pages = []
+        text_pages = 0
+        for page_text in self.iter_text(source):
+            if page_text.startswith("Error reading"):
+                return page_text, False
+            pages.append(page_text)
+            if not page_text.strip():
+                continue
+            text_pages += 1
+            if text_pages == CLASSIFY_PAGES:
+                text_lower = "\n".join(pages).lower()
+                if not any(keyword in text_lower for keyword in PO_KEYWORDS):
+                    return "\n".join(pages).strip(), False
+        text = "\n".join(pages).strip()
+        text_lower = text.lower()
+        return text, any(keyword in text_lower for keyword in PO_KEYWORDS)
+
+    def build_rag_prompt(self, po_text, top_k=2, line_items_extracted=False, query_embedding=None):
+        # Examples from the same supplier are the most useful; a name match picks the partition
+        supplier = guess_supplier(po_text, db_manager.get_supplier_names())
+        context_snippets = select_examples(
+            self.vector_store, po_text, top_k=top_k, query_embedding=query_embedding, supplier=supplier
+        )
         context_text = "\n\n".join(context_snippets)
         rag_prompt = (
             f"You have the following validated PO examples:\n"
@@ -83,19 +153,20 @@ class POValidator(ABC):
             f"{po_text}\n\n"
             f"{self.base_prompt}"
         )
+        if line_items_extracted:
+            rag_prompt += (
+                "\n\nThe line items have already been read from the document's tables and are not "
+                "included in the text above. Return \"line_items\" as an empty array and do not list it as missing."
+            )
         return rag_prompt
 
-    def store_po_context(self, po_text, extracted_fields):
-        chunk = (
-            "PAST VALIDATED PO EXAMPLE:\n\n"
-            f"Raw PO Text:\n{po_text}\n\n"
-            "Extracted Fields:\n"
-            f"{json.dumps(extracted_fields, indent=2)}\n"
-        )
-        self.vector_store.add_texts([chunk])
-        self.vector_store.persist()
+    def store_po_context(self, po_text, extracted_fields, embedding=None):
+        chunk = compact_example("PO", po_text, extracted_fields)
+        # Queued and written in batches; see utils.vector_stores.VectorStoreWriter.
+        metadata = example_metadata(po_text, extracted_fields, "po")
+        get_vector_store_writer("purchase_orders").add(chunk, embedding, metadata)
 
-    def validate_po(self, file_path: str) -> dict:
+    def validate_po(self, source) -> dict:
         validation_result = {
             "is_valid_format": False,
             "is_corrupted": False,
@@ -105,8 +176,8 @@ class POValidator(ABC):
             "anomalies": []
         }
         try:
-            with open(file_path, "rb") as f:
-                file_bytes = f.read()
+            # Read once: the same buffer is hashed and parsed
+            file_bytes = read_bytes(source)
             file_hash = hashlib.sha256(file_bytes).hexdigest()
 
             # Check for duplicate using the PO duplicate method.
@@ -114,53 +185,98 @@ class POValidator(ABC):
                 validation_result["is_duplicate"] = True
                 validation_result["anomalies"].append("Duplicate purchase order detected.")
 
-            po_text = self.extract_text(file_path)
+            # A previously validated copy of this exact file: reuse its result
+            cached_result = db_manager.get_cached_validation(
+                file_hash, "po", EXTRACTOR_VERSION, self.prompt_hash, self.model_version
+            )
+            if cached_result is not None:
+                cached_result["is_duplicate"] = cached_result["is_duplicate"] or validation_result["is_duplicate"]
+                return cached_result
+
+            po_text, recognized = self.read_document(file_bytes)
             if not po_text or po_text.startswith("Error reading"):
                 validation_result["is_corrupted"] = True
                 validation_result["anomalies"].append("File extraction error: " + po_text)
                 return validation_result
 
-            text_lower = po_text.lower()
-            if not any(keyword in text_lower for keyword in PO_KEYWORDS):
+            if not recognized:
                 validation_result["anomalies"].append("Document not recognized as purchase order (keyword check).")
                 return validation_result
 
+            # The local classifier rejects other document types before any network call
+            rejection = check_document_type(po_text, "po")
+            if rejection:
+                validation_result["anomalies"].append(rejection)
+                return validation_result
+
+            # Embed the document once: the vector serves the duplicate check, retrieval and storage
+            query_embedding = None
             try:
-                results = self.vector_store.similarity_search_with_score(po_text, k=1)
+                query_embedding = self.vector_store.embeddings.embed_query(po_text)
+                results = self.vector_store.similarity_search_by_vector_with_relevance_scores(query_embedding, k=1)
                 if results and results[0][1] < 0.2:
                     validation_result["is_duplicate"] = True
             except Exception as e:
                 validation_result["anomalies"].append(f"Vector search error: {str(e)}")
 
-            prompt_text = self.build_rag_prompt(po_text, top_k=2)
-            llm_response = self.llm.invoke(prompt_text)
-            raw_text = llm_response.content if hasattr(llm_response, "content") else str(llm_response)
-            start_index = raw_text.find('{')
-            end_index = raw_text.rfind('}') + 1
-            json_str = raw_text[start_index:end_index] if start_index != -1 and end_index != -1 else raw_text
+            # Well-formed structured exports are mapped directly; the LLM is the fallback
+            parsed_result = self.extract_structured_fields(file_bytes)
+            table_line_items = None
+            if parsed_result is None:
+                # Line items read from table geometry keep them out of the prompt and the response
+                table = self.extract_line_items(file_bytes)
+                if table is not None:
+                    table_line_items, header_text = table
+                    prompt_text = self.build_rag_prompt(
+                        header_text, top_k=2, line_items_extracted=True, query_embedding=query_embedding
+                    )
+                else:
+                    prompt_text = self.build_rag_prompt(po_text, top_k=2, query_embedding=query_embedding)
+                llm_response = invoke_with_quota(self.llm, prompt_text, count_tokens(prompt_text))
+                raw_text = llm_response.content if hasattr(llm_response, "content") else str(llm_response)
+                start_index = raw_text.find('{')
+                end_index = raw_text.rfind('}') + 1
+                json_str = raw_text[start_index:end_index] if start_index != -1 and end_index != -1 else raw_text
 
+            cacheable = False
             try:
-                parsed_result = json.loads(json_str)
+                if parsed_result is None:
+                    parsed_result = json.loads(json_str)
                 val = parsed_result.get("validation", {})
                 validation_result["is_valid_format"] = val.get("valid_format", False)
                 validation_result["missing_fields"] = val.get("missing_fields", [])
                 validation_result["anomalies"] = val.get("anomalies", [])
                 extracted = parsed_result.get("extracted_fields", {})
+                if table_line_items:
+                    extracted["line_items"] = table_line_items
+                    validation_result["missing_fields"] = [
+                        f for f in validation_result["missing_fields"] if f != "line_items"
+                    ]
                 final_fields = {}
                 for field in self.REQUIRED_FIELDS:
                     final_fields[field] = extracted.get(field, "N/A")
                 # Optional fields can be added if needed.
                 validation_result["extracted_fields"] = final_fields
+                cacheable = True
             except Exception as parse_error:
                 validation_result["anomalies"].append(f"Failed to parse JSON: {str(parse_error)}")
 
-            if validation_result["is_valid_format"]:
+            # Duplicates are neither stored again nor added as another example
+            if validation_result["is_valid_format"] and not validation_result["is_duplicate"]:
                 try:
-                    self.store_po_context(po_text, validation_result["extracted_fields"])
-                    if not validation_result["is_duplicate"]:
-                        db_manager.store_purchase_order(file_hash, validation_result["extracted_fields"])
+                    self.store_po_context(po_text, validation_result["extracted_fields"], query_embedding)
+                    db_manager.store_purchase_order(file_hash, validation_result["extracted_fields"])
                 except Exception as e:
                     validation_result["anomalies"].append(f"Failed to store PO in DB: {str(e)}")
+                    cacheable = False
+
+            if cacheable:
+                try:
+                    db_manager.store_cached_validation(
+                        file_hash, "po", EXTRACTOR_VERSION, self.prompt_hash, self.model_version, validation_result
+                    )
+                except Exception as e:
+                    validation_result["anomalies"].append(f"Failed to cache validation result: {str(e)}")
         except Exception as e:
             validation_result["anomalies"].append(str(e))
         return validation_result
@@ -168,46 +284,74 @@ class POValidator(ABC):
 # Concrete implementations for different file types:
 
 class PDFPOValidator(POValidator):
-    def extract_text(self, file_path: str) -> str:
+    def iter_text(self, source):
         try:
-            doc = pymupdf.open(file_path)
-            text = ""
-            for page in doc:
-                page_text = page.get_text().strip()
-                if page_text:
-                    text += page_text + "\n"
-                else:
-                    pix = page.get_pixmap(dpi=300)
-                    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                    ocr_text = pytesseract.image_to_string(img)
-                    text += ocr_text + "\n"
+            doc = open_pdf(source)
+            found_text = False
+            for page_text in iter_pdf_pages(doc, keywords=PO_KEYWORDS, first_pages=CLASSIFY_PAGES):
+                page_text = CommonOCRErrors.post_process_ocr_text(page_text)
+                found_text = found_text or bool(page_text.strip())
+                yield page_text
+            if not found_text:
+                yield "No readable text found in PDF."
+        except Exception as e:
+            yield f"Error reading PO PDF: {str(e)}"
+
+    def extract_text(self, source) -> str:
+        try:
+            doc = open_pdf(source)
+            text = "".join(page_text + "\n" for page_text in extract_pdf_pages(doc, keywords=PO_KEYWORDS))
             text = CommonOCRErrors.post_process_ocr_text(text)
             return text.strip() if text.strip() else "No readable text found in PDF."
         except Exception as e:
             return f"Error reading PO PDF: {str(e)}"
 
+    def extract_line_items(self, source):
+        """Read line items from PyMuPDF table detection on text-layer PDFs."""
+        try:
+            return extract_table_line_items(open_pdf(source))
+        except Exception:
+            return None
+
 class CSVPOValidator(POValidator):
-    def extract_text(self, file_path: str) -> str:
+    def extract_text(self, source) -> str:
         try:
-            df = pd.read_csv(file_path)
+            df = pd.read_csv(as_file(source))
             return df.to_string()
         except Exception as e:
             return f"Error reading CSV PO: {str(e)}"
 
+    def extract_structured_fields(self, source):
+        """Map CSV columns (header synonyms, one row per line item) to PO fields."""
+        try:
+            df = pd.read_csv(as_file(source), dtype=str, keep_default_na=False)
+        except Exception:
+            return None
+        return map_csv_fields(df, self.REQUIRED_FIELDS)
+
 class XMLPOValidator(POValidator):
-    def extract_text(self, file_path: str) -> str:
+    def extract_text(self, source) -> str:
         try:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            return ET.tostring(root, encoding='unicode')
+            text, _, _ = parse_xml(as_file(source))
+            return text
         except Exception as e:
             return f"Error reading XML PO: {str(e)}"
 
+    def extract_structured_fields(self, source):
+        """Map UBL/cXML documents straight to fields; unknown schemas go to the LLM."""
+        try:
+            _, fields, schema = parse_xml(as_file(source))
+        except Exception:
+            return None
+        if schema is None:
+            return None
+        return build_structured_result(fields, self.REQUIRED_FIELDS)
+
 class ImagePOValidator(POValidator):
-    def extract_text(self, file_path: str) -> str:
+    def extract_text(self, source) -> str:
         try:
-            img = Image.open(file_path)
-            raw_text = pytesseract.image_to_string(img)
+            img = Image.open(as_file(source))
+            raw_text = ocr_image(img)
             return raw_text.strip() if raw_text.strip() else "No readable text found in image."
         except Exception as e:
             return f"Error reading PO image: {str(e)}"
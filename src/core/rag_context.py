@@ -0,0 +1,150 @@
+# src/core/rag_context.py
+
+import os
+import json
+import time
+import re
+import hashlib
+from functools import lru_cache
+
+# Token budget for all retrieved examples in one extraction prompt.
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS") or 1200)
+# Characters of the raw document kept in a stored example, after the fields.
+RAG_EXCERPT_CHARS = int(os.getenv("RAG_EXCERPT_CHARS") or 600)
+# Line items kept in a stored example; the rest are summarised by count.
+RAG_EXAMPLE_LINE_ITEMS = 3
+# MMR candidates fetched per query and the relevance/diversity trade-off
+# (1 = pure relevance, 0 = maximum diversity).
+RAG_FETCH_K = int(os.getenv("RAG_FETCH_K") or 8)
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA") or 0.5)
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # tiktoken missing, or its encoding files cannot be fetched offline
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Token count of text (tiktoken when available, otherwise ~4 characters per token)."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def compact_example(label: str, text: str, extracted_fields: dict) -> str:
+    """
+    Compact stored form of a validated document: its fields as one-line JSON
+    (at most RAG_EXAMPLE_LINE_ITEMS line items) and the first RAG_EXCERPT_CHARS
+    characters of its text, so an example shows the input/output pairing at a
+    fraction of the raw document's length.
+    """
+    fields = dict(extracted_fields)
+    line_items = fields.get("line_items")
+    if isinstance(line_items, list) and len(line_items) > RAG_EXAMPLE_LINE_ITEMS:
+        fields["line_items"] = line_items[:RAG_EXAMPLE_LINE_ITEMS]
+        fields["line_items_omitted"] = len(line_items) - RAG_EXAMPLE_LINE_ITEMS
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    excerpt = "\n".join(lines)[:RAG_EXCERPT_CHARS]
+    return (
+        f"PAST VALIDATED {label} EXAMPLE:\n"
+        f"Text excerpt:\n{excerpt}\n"
+        f"Extracted Fields: {json.dumps(fields, separators=(',', ':'))}\n"
+    )
+
+
+def normalize_supplier(name) -> str:
+    """Lowercase a supplier name and reduce punctuation to single spaces ('ACME, Inc.' -> 'acme inc')."""
+    name = str(name or "").strip()
+    if name.upper() == "N/A":
+        return ""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", name.lower()).split())
+
+
+def guess_supplier(text: str, supplier_names: list) -> str:
+    """
+    Normalised name of the known supplier mentioned in text (the longest one
+    when several match), or "" when none is. Names shorter than three
+    characters are ignored to avoid accidental matches.
+    """
+    haystack = f" {normalize_supplier(text)} "
+    best = ""
+    for name in supplier_names:
+        supplier = normalize_supplier(name)
+        if len(supplier) >= 3 and len(supplier) > len(best) and f" {supplier} " in haystack:
+            best = supplier
+    return best
+
+
+def example_metadata(text: str, extracted_fields: dict, document_type: str) -> dict:
+    """
+    Metadata stored with an example: a hash of its whitespace-normalised text
+    (insert-time deduplication), its supplier (retention cap and filtered
+    retrieval), the document type and the document date.
+    """
+    date = extracted_fields.get("invoice_date") or extracted_fields.get("po_date") or ""
+    return {
+        "content_hash": hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest(),
+        "supplier": normalize_supplier(extracted_fields.get("supplier_name")),
+        "document_type": document_type,
+        "document_date": "" if str(date).upper() == "N/A" else str(date),
+        "created_at": time.time(),
+    }
+
+
+def _mmr_search(vector_store, query_text: str, k: int, query_embedding=None, filter: dict = None) -> list:
+    kwargs = {"k": k, "fetch_k": max(RAG_FETCH_K, k), "lambda_mult": RAG_MMR_LAMBDA}
+    if filter:
+        kwargs["filter"] = filter
+    if query_embedding is not None:
+        return vector_store.max_marginal_relevance_search_by_vector(query_embedding, **kwargs)
+    return vector_store.max_marginal_relevance_search(query_text, **kwargs)
+
+
+def select_examples(vector_store, query_text: str, top_k: int = 2, query_embedding=None,
+                    max_tokens: int = RAG_CONTEXT_TOKENS, supplier: str = "") -> list:
+    """
+    Retrieve up to top_k examples with maximal marginal relevance (so
+    near-identical examples are not both included) and keep them within
+    max_tokens: examples are taken in MMR order, and one that does not fit is
+    cut to the remaining budget.
+    With a supplier (see guess_supplier), that supplier's examples are searched
+    first, and the rest of the collection only tops up a short result.
+    """
+    docs = []
+    if supplier:
+        docs = _mmr_search(vector_store, query_text, top_k, query_embedding, filter={"supplier": supplier})
+    if len(docs) < top_k:
+        seen = {doc.page_content for doc in docs}
+        for doc in _mmr_search(vector_store, query_text, top_k, query_embedding):
+            if len(docs) < top_k and doc.page_content not in seen:
+                docs.append(doc)
+
+    snippets = []
+    remaining = max_tokens
+    for doc in docs:
+        snippet = doc.page_content.strip()
+        tokens = count_tokens(snippet)
+        if tokens > remaining:
+            snippet = truncate_to_tokens(snippet, remaining)
+            tokens = remaining
+        if snippet:
+            snippets.append(snippet)
+            remaining -= tokens
+        if remaining <= 0:
+            break
+    return snippets
@@ -0,0 +1,233 @@
+# src/core/xml_extractor.py
+
+import xml.etree.ElementTree as ET
+
+# Known e-invoicing schemas, matched on local element names (namespaces ignored).
+# "fields" maps a field to candidate paths below the document element, most
+# preferred first; a path ending in "@name" reads an attribute, and a path to
+# an element with children (e.g. an address) yields its texts joined by ", ".
+# "line" is the local name of the line-item element and "line_fields" maps
+# paths below it to line item keys.
+SCHEMAS = {
+    "ubl_invoice": {
+        "fields": {
+            "invoice_number": ["ID"],
+            "invoice_date": ["IssueDate"],
+            "due_date": ["DueDate", "PaymentMeans/PaymentDueDate"],
+            "invoice_to": ["AccountingCustomerParty/Party/PartyName/Name",
+                           "AccountingCustomerParty/Party/PartyLegalEntity/RegistrationName"],
+            "supplier_name": ["AccountingSupplierParty/Party/PartyName/Name",
+                              "AccountingSupplierParty/Party/PartyLegalEntity/RegistrationName"],
+            "billing_address": ["AccountingCustomerParty/Party/PostalAddress"],
+            "shipping_address": ["Delivery/DeliveryLocation/Address", "Delivery/DeliveryAddress"],
+            "total_amount": ["LegalMonetaryTotal/PayableAmount", "LegalMonetaryTotal/TaxInclusiveAmount"],
+            "discount": ["LegalMonetaryTotal/AllowanceTotalAmount"],
+            "tax_vat": ["TaxTotal/TaxAmount"],
+            "email": ["AccountingSupplierParty/Party/Contact/ElectronicMail"],
+            "phone_number": ["AccountingSupplierParty/Party/Contact/Telephone"],
+            "po_number": ["OrderReference/ID"],
+        },
+        "line": "InvoiceLine",
+        "line_fields": {
+            "description": ["Item/Name", "Item/Description"],
+            "quantity": ["InvoicedQuantity"],
+            "unit_price": ["Price/PriceAmount"],
+            "amount": ["LineExtensionAmount"],
+        },
+    },
+    "ubl_order": {
+        "fields": {
+            "po_number": ["ID"],
+            "po_date": ["IssueDate"],
+            "supplier_name": ["SellerSupplierParty/Party/PartyName/Name",
+                              "SellerSupplierParty/Party/PartyLegalEntity/RegistrationName"],
+            "billing_address": ["AccountingCustomerParty/Party/PostalAddress",
+                                "BuyerCustomerParty/Party/PostalAddress"],
+            "shipping_address": ["Delivery/DeliveryAddress", "Delivery/DeliveryLocation/Address"],
+            "subtotal": ["AnticipatedMonetaryTotal/LineExtensionAmount"],
+            "tax": ["TaxTotal/TaxAmount"],
+            "total": ["AnticipatedMonetaryTotal/PayableAmount"],
+        },
+        "line": "LineItem",
+        "line_fields": {
+            "description": ["Item/Name", "Item/Description"],
+            "quantity": ["Quantity"],
+            "unit_price": ["Price/PriceAmount"],
+            "amount": ["LineExtensionAmount"],
+        },
+    },
+    "cxml_invoice": {
+        "fields": {
+            "invoice_number": ["Request/InvoiceDetailRequest/InvoiceDetailRequestHeader/@invoiceID"],
+            "invoice_date": ["Request/InvoiceDetailRequest/InvoiceDetailRequestHeader/@invoiceDate"],
+            "supplier_name": ["Header/From/Credential/Identity"],
+            "total_amount": ["Request/InvoiceDetailRequest/InvoiceDetailSummary/DueAmount/Money",
+                             "Request/InvoiceDetailRequest/InvoiceDetailSummary/NetAmount/Money",
+                             "Request/InvoiceDetailRequest/InvoiceDetailSummary/GrossAmount/Money"],
+            "tax_vat": ["Request/InvoiceDetailRequest/InvoiceDetailSummary/Tax/Money"],
+            "discount": ["Request/InvoiceDetailRequest/InvoiceDetailSummary/InvoiceDetailDiscount/Money"],
+        },
+        "line": "InvoiceDetailItem",
+        "line_fields": {
+            "description": ["InvoiceDetailItemReference/Description"],
+            "quantity": ["@quantity"],
+            "unit_price": ["UnitPrice/Money"],
+            "amount": ["SubtotalAmount/Money"],
+        },
+    },
+    "cxml_order": {
+        "fields": {
+            "po_number": ["Request/OrderRequest/OrderRequestHeader/@orderID"],
+            "po_date": ["Request/OrderRequest/OrderRequestHeader/@orderDate"],
+            "supplier_name": ["Header/To/Credential/Identity"],
+            "billing_address": ["Request/OrderRequest/OrderRequestHeader/BillTo/Address"],
+            "shipping_address": ["Request/OrderRequest/OrderRequestHeader/ShipTo/Address"],
+            "tax": ["Request/OrderRequest/OrderRequestHeader/Tax/Money"],
+            "total": ["Request/OrderRequest/OrderRequestHeader/Total/Money"],
+        },
+        "line": "ItemOut",
+        "line_fields": {
+            "description": ["ItemDetail/Description"],
+            "quantity": ["@quantity"],
+            "unit_price": ["ItemDetail/UnitPrice/Money"],
+        },
+    },
+}
+
+
+def local_name(tag: str) -> str:
+    """Strip the '{namespace}' prefix from an ElementTree tag."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def detect_schema(path: list):
+    """Return the SCHEMAS key for a document, given the local-name path of an element being opened."""
+    if len(path) == 1 and path[0] == "Invoice":
+        return "ubl_invoice"
+    if len(path) == 1 and path[0] == "Order":
+        return "ubl_order"
+    if len(path) == 3 and path[0] == "cXML" and path[1] == "Request":
+        return {"InvoiceDetailRequest": "cxml_invoice", "OrderRequest": "cxml_order"}.get(path[2])
+    return None
+
+
+class _FieldCollector:
+    """Keeps the most preferred value seen so far for each field of a path -> field mapping."""
+
+    def __init__(self, mapping: dict):
+        self.ranks = {}
+        for field, paths in mapping.items():
+            for rank, path in enumerate(paths):
+                self.ranks[path] = (field, rank)
+        self.containers = {p for p in self.ranks if "@" not in p}
+        self.values = {}
+        self._best = {}
+
+    def offer(self, path: str, value: str):
+        match = self.ranks.get(path)
+        if match and value:
+            field, rank = match
+            if rank < self._best.get(field, len(self.ranks)):
+                self.values[field] = value
+                self._best[field] = rank
+
+
+def parse_xml(source):
+    """
+    Stream an XML document with iterparse and return (text, fields, schema).
+
+    text is a compact 'path: value' flattening of every element text and
+    attribute (local names, no namespaces), suitable for keyword checks and the
+    LLM prompt. For UBL Invoice/Order and cXML invoice/order documents, fields
+    holds the unified field names (line items included); schema names the
+    matched SCHEMAS entry, or is None for unknown documents (fields is then empty).
+    Elements are discarded as soon as they are processed, so memory stays
+    bounded by the document depth rather than its size.
+    """
+    lines = []
+    path = []          # local names from the document element down
+    elements = []      # open elements, parallel to path
+    captures = []      # open container elements: [relative path, collector, [texts]]
+    schema_name = None
+    schema = None
+    header = None
+    line = None        # (depth of the line element, collector) while inside a line item
+    line_items = []
+    # cXML puts <Header> (supplier credentials) before the <Request> that
+    # identifies the schema: header values are kept until the schema is known.
+    early_offers = []  # (path relative to the document element, value)
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            path.append(local_name(elem.tag))
+            elements.append(elem)
+            if schema is None and len(path) <= 3:
+                schema_name = detect_schema(path)
+                if schema_name:
+                    schema = SCHEMAS[schema_name]
+                    header = _FieldCollector(schema["fields"])
+                    for relative, value in early_offers:
+                        header.offer(relative, value)
+                    early_offers = []
+            if schema is not None:
+                if line is None and path[-1] == schema["line"]:
+                    line = (len(path), _FieldCollector(schema["line_fields"]))
+                for collector, relative in _targets(path, header, line):
+                    if relative in collector.containers:
+                        captures.append([relative, collector, []])
+            continue
+
+        # event == "end"
+        relative_path = "/".join(path[1:])
+        text = (elem.text or "").strip()
+        attributes = {local_name(k): v.strip() for k, v in elem.attrib.items() if v.strip()}
+        if text or attributes:
+            value = " ".join([text] + [f"[{k}={v}]" for k, v in attributes.items()]).strip()
+            lines.append(f"{relative_path or path[0]}: {value}")
+
+        if schema is None and path[:2] == ["cXML", "Header"]:
+            early_offers.append((relative_path, text))
+            early_offers.extend((f"{relative_path}/@{name}", value) for name, value in attributes.items())
+        if schema is not None:
+            for collector, relative in _targets(path, header, line):
+                collector.offer(relative, text)
+                for name, value in attributes.items():
+                    collector.offer(f"{relative}/@{name}" if relative else f"@{name}", value)
+            if text:
+                for capture in captures:
+                    capture[2].append(text)
+            while captures and captures[-1][0] == _relative_for(path, captures[-1][1], header, line):
+                relative, collector, texts = captures.pop()
+                collector.offer(relative, ", ".join(texts))
+            if line is not None and len(path) == line[0]:
+                item = line[1].values
+                line_items.append({key: item.get(key, "N/A") for key in ("description", "quantity", "unit_price", "amount")})
+                line = None
+
+        path.pop()
+        elements.pop()
+        if elements:
+            elements[-1].remove(elem)
+        elem.clear()
+
+    fields = dict(header.values) if header is not None else {}
+    if line_items:
+        fields["line_items"] = line_items
+    return "\n".join(lines), fields, schema_name
+
+
+def _targets(path: list, header, line):
+    """(collector, path relative to it) pairs that an element at path may feed."""
+    targets = []
+    if header is not None:
+        targets.append((header, "/".join(path[1:])))
+    if line is not None and len(path) >= line[0]:
+        targets.append((line[1], "/".join(path[line[0]:])))
+    return targets
+
+
+def _relative_for(path: list, collector, header, line) -> str:
+    """Path of the element at path relative to the given collector's root."""
+    if line is not None and collector is line[1]:
+        return "/".join(path[line[0]:])
+    return "/".join(path[1:])
@@ -0,0 +1,103 @@
+# utils/cache.py
+
+import sqlite3
+import threading
+import time
+
+
+class SQLiteCache:
+    """
+    Key/value cache persisted in a local SQLite file.
+    Entries are evicted least-recently-used first once the cache holds more
+    than max_entries rows or more than max_bytes of values, and entries older
+    than ttl seconds are treated as missing. hits/misses count get() results
+    in this process.
+    """
+
+    def __init__(self, path: str, max_entries: int = None, max_bytes: int = None, ttl: float = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.init_db()
+
+    def init_db(self):
+        conn = sqlite3.connect(self.path)
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed_at ON cache (accessed_at)")
+        conn.commit()
+        conn.close()
+
+    def get(self, key: str):
+        """Returns the cached value for key (marking it as recently used), or None."""
+        with self._lock:
+            conn = sqlite3.connect(self.path)
+            cursor = conn.cursor()
+            cursor.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,))
+            row = cursor.fetchone()
+            now = time.time()
+            if row and self.ttl is not None and row[1] < now - self.ttl:
+                cursor.execute("DELETE FROM cache WHERE key = ?", (key,))
+                conn.commit()
+                row = None
+            elif row:
+                cursor.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+            conn.close()
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row[0] if row else None
+
+    def set(self, key: str, value: str):
+        """Stores value under key, then evicts the least recently used entries over the limits."""
+        with self._lock:
+            conn = sqlite3.connect(self.path)
+            cursor = conn.cursor()
+            now = time.time()
+            cursor.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, accessed_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now)
+            )
+            self._evict(cursor)
+            conn.commit()
+            conn.close()
+
+    def _evict(self, cursor):
+        if self.ttl is not None:
+            cursor.execute("DELETE FROM cache WHERE created_at < ?", (time.time() - self.ttl,))
+        if self.max_entries is not None:
+            cursor.execute("""
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+        if self.max_bytes is not None:
+            cursor.execute("""
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS running_size
+                        FROM cache
+                    ) WHERE running_size > ?
+                )
+            """, (self.max_bytes,))
+
+    def clear(self):
+        with self._lock:
+            conn = sqlite3.connect(self.path)
+            conn.execute("DELETE FROM cache")
+            conn.commit()
+            conn.close()
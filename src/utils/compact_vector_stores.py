@@ -0,0 +1,29 @@
+# utils/compact_vector_stores.py
+"""
+Offline compaction of the example vector stores.
+
+    PYTHONPATH=src python -m utils.compact_vector_stores [invoices purchase_orders] [--max-per-supplier N]
+
+Run it while the app is stopped: each collection is rebuilt from its stored
+vectors with one example per content hash and at most N per supplier.
+"""
+
+import argparse
+
+from utils.vector_stores import EXAMPLES_PER_SUPPLIER, VECTOR_STORES, compact_vector_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the example vector stores without redundant entries.")
+    parser.add_argument("stores", nargs="*", default=list(VECTOR_STORES), choices=list(VECTOR_STORES))
+    parser.add_argument("--max-per-supplier", type=int, default=EXAMPLES_PER_SUPPLIER,
+                        help="examples kept per supplier, newest first (0 = no cap)")
+    args = parser.parse_args()
+
+    for name in args.stores:
+        before, after = compact_vector_store(name, args.max_per_supplier)
+        print(f"{name}: {before} -> {after} examples")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# utils/concurrency.py
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Documents validated at once by validate_many().
+VALIDATION_CONCURRENCY = int(os.getenv("VALIDATION_CONCURRENCY") or 4)
+
+# OpenAI quota shared by every LLM call in the process (0 = unlimited).
+OPENAI_RPM = int(os.getenv("OPENAI_RPM") or 0)
+OPENAI_TPM = int(os.getenv("OPENAI_TPM") or 0)
+# Completion tokens charged per call on top of the prompt, before the response is known.
+LLM_COMPLETION_TOKENS = int(os.getenv("LLM_COMPLETION_TOKENS") or 1000)
+
+_openai_limiter = None
+_openai_limiter_lock = threading.Lock()
+
+
+class TokenBucketLimiter:
+    """
+    Thread-safe requests-per-minute / tokens-per-minute limiter.
+    Each limit is a bucket holding up to one minute of budget that refills
+    continuously; acquire() blocks until both buckets can pay for the call.
+    A call larger than a whole minute of tokens waits for a full bucket.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute,
+                                 self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens: int = 0):
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                wait = 0.0
+                if self.requests_per_minute and self._requests < 1:
+                    wait = (1 - self._requests) * 60 / self.requests_per_minute
+                if self.tokens_per_minute and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+                if wait == 0:
+                    if self.requests_per_minute:
+                        self._requests -= 1
+                    if self.tokens_per_minute:
+                        self._tokens -= tokens
+                    return
+            time.sleep(wait)
+
+
+def get_openai_limiter() -> TokenBucketLimiter:
+    """Returns the limiter shared by every OpenAI LLM call in the process (OPENAI_RPM/OPENAI_TPM)."""
+    global _openai_limiter
+    with _openai_limiter_lock:
+        if _openai_limiter is None:
+            _openai_limiter = TokenBucketLimiter(OPENAI_RPM, OPENAI_TPM)
+        return _openai_limiter
+
+
+def wait_for_openai_quota(prompt_tokens: int):
+    """Block until the shared OpenAI quota allows one more LLM call with a prompt of this size."""
+    get_openai_limiter().acquire(prompt_tokens + LLM_COMPLETION_TOKENS)
+
+
+def map_concurrently(func, items, max_workers: int = None, ordered: bool = True):
+    """
+    Apply func to every item on a pool of max_workers threads
+    (default VALIDATION_CONCURRENCY).
+    ordered=True returns the results as a list in input order; ordered=False
+    returns an iterator of (input index, result) pairs as they finish.
+    func is expected to report its own errors in its result.
+    """
+    items = list(items)
+    executor = ThreadPoolExecutor(max_workers=max_workers or VALIDATION_CONCURRENCY)
+    if ordered:
+        with executor:
+            return list(executor.map(func, items))
+
+    def stream():
+        with executor:
+            futures = {executor.submit(func, item): index for index, item in enumerate(items)}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    return stream()
@@ -101,6 +101,81 @@ class DatabaseManager:
             )
         """)
 
+        # ===========================================
+        # validation_cache Table
+        # ===========================================
+        # Complete validation_result per uploaded file, keyed by file_hash and
+        # document type. extractor_version/prompt_hash/model record what produced
+        # the result so an extraction, prompt or model change invalidates the entry.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS validation_cache (
+                file_hash TEXT NOT NULL,
+                document_type TEXT NOT NULL,
+                extractor_version TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                validation_result TEXT NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (file_hash, document_type)
+            )
+        """)
+
+        conn.commit()
+        conn.close()
+
+    # ---------------------------------------------------------------------
+    #                   VALIDATION RESULT CACHE
+    # ---------------------------------------------------------------------
+    def get_cached_validation(self, file_hash: str, document_type: str, extractor_version: str,
+                              prompt_hash: str, model: str):
+        """
+        Returns the stored validation_result dict for this file and document type,
+        or None if there is no entry or it was produced by a different extractor/prompt/model.
+        """
+        conn = sqlite3.connect(DatabaseManager.DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT validation_result FROM validation_cache
+            WHERE file_hash = ? AND document_type = ? AND extractor_version = ? AND prompt_hash = ? AND model = ?
+        """, (file_hash, document_type, extractor_version, prompt_hash, model))
+        row = cursor.fetchone()
+        conn.close()
+
+        if row:
+            return json.loads(row[0])
+        return None
+
+    def store_cached_validation(self, file_hash: str, document_type: str, extractor_version: str,
+                                prompt_hash: str, model: str, validation_result: dict):
+        """
+        Stores (or replaces) the validation_result for this file and document type.
+        """
+        conn = sqlite3.connect(DatabaseManager.DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR REPLACE INTO validation_cache (
+                file_hash,
+                document_type,
+                extractor_version,
+                prompt_hash,
+                model,
+                validation_result
+            ) VALUES (?, ?, ?, ?, ?, ?)
+        """, (
+            file_hash,
+            document_type,
+            extractor_version,
+            prompt_hash,
+            model,
+            json.dumps(validation_result)
+        ))
+        conn.commit()
+        conn.close()
+
+    def clear_validation_cache(self):
+        conn = sqlite3.connect(DatabaseManager.DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM validation_cache")
         conn.commit()
         conn.close()
 
@@ -408,6 +483,21 @@ class DatabaseManager:
             })
         return line_items
 
+    def get_supplier_names(self):
+        """
+        Return the distinct supplier names seen on stored invoices and purchase orders.
+        """
+        conn = sqlite3.connect(DatabaseManager.DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT supplier_name FROM invoices WHERE supplier_name IS NOT NULL AND supplier_name != ''
+            UNION
+            SELECT supplier_name FROM purchase_orders WHERE supplier_name IS NOT NULL AND supplier_name != ''
+        """)
+        rows = cursor.fetchall()
+        conn.close()
+        return [r[0] for r in rows]
+
     # ---------------------------------------------------------------------
     #    CLEAR TABLES (FOR TESTING/RESEEDING)
     # ---------------------------------------------------------------------
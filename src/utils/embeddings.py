@@ -0,0 +1,65 @@
+# utils/embeddings.py
+
+import os
+import base64
+import hashlib
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+from utils.cache import SQLiteCache
+
+# Embeddings are cached on disk by (model, sha256(text)), so repeated uploads,
+# chatbot queries and re-indexing never pay for the same text twice.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH") or "embedding_cache.db"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES") or 20000)
+
+
+def _encode_vector(vector) -> str:
+    return base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+
+
+def _decode_vector(value: str) -> list:
+    vector = array("f")
+    vector.frombytes(base64.b64decode(value))
+    return vector.tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves repeated texts from a SQLiteCache and only
+    sends cache misses to the underlying client (in one batched request).
+    """
+
+    def __init__(self, underlying: Embeddings, cache: SQLiteCache = None, model: str = None):
+        self.underlying = underlying
+        self.cache = cache or SQLiteCache(EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+        self.model = model or getattr(underlying, "model", type(underlying).__name__)
+
+    def _key(self, text: str) -> str:
+        return f"{self.model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def embed_documents(self, texts: list) -> list:
+        vectors = [None] * len(texts)
+        missing = []
+        for index, text in enumerate(texts):
+            cached = self.cache.get(self._key(text))
+            if cached is not None:
+                vectors[index] = _decode_vector(cached)
+            else:
+                missing.append(index)
+
+        if missing:
+            new_vectors = self.underlying.embed_documents([texts[index] for index in missing])
+            for index, vector in zip(missing, new_vectors):
+                vectors[index] = vector
+                self.cache.set(self._key(texts[index]), _encode_vector(vector))
+        return vectors
+
+    def embed_query(self, text: str) -> list:
+        cached = self.cache.get(self._key(text))
+        if cached is not None:
+            return _decode_vector(cached)
+        vector = self.underlying.embed_query(text)
+        self.cache.set(self._key(text), _encode_vector(vector))
+        return vector
@@ -0,0 +1,391 @@
+# utils/faiss_store.py
+
+import os
+import json
+import shutil
+import sqlite3
+import threading
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+
+def _mmap_flags() -> int:
+    # IO_FLAG_MMAP_IFC (faiss >= 1.9) maps the flat vector codes themselves;
+    # older releases only honour IO_FLAG_MMAP for on-disk inverted lists.
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+
+# Every add writes its vectors to a new shard file instead of rewriting the
+# index. Once a store holds more than FAISS_MAX_SHARDS shards, the smallest
+# ones are merged into one, so large shards are rarely rewritten.
+FAISS_MAX_SHARDS = int(os.getenv("FAISS_MAX_SHARDS") or 8)
+
+# Metadata keys with an SQLite expression index, for get(where=...) lookups.
+INDEXED_METADATA = ["content_hash", "supplier"]
+
+
+def _where_sql(where: dict):
+    """
+    Translate a Chroma-style metadata filter ({"key": value}, {"key": {"$in": [...]}},
+    {"$and": [...]}) into an SQL condition on the examples table and its parameters.
+    """
+    if "$and" in where:
+        parts = [_where_sql(clause) for clause in where["$and"]]
+        return " AND ".join(f"({sql})" for sql, _ in parts), [p for _, params in parts for p in params]
+    conditions, params = [], []
+    for key, condition in where.items():
+        column = f"json_extract(metadata, '$.{key}')"
+        if isinstance(condition, dict) and "$in" in condition:
+            values = list(condition["$in"])
+            if not values:
+                conditions.append("0")
+                continue
+            conditions.append(f"{column} IN ({','.join('?' for _ in values)})")
+            params.extend(values)
+        else:
+            value = condition["$eq"] if isinstance(condition, dict) else condition
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    return " AND ".join(conditions) or "1", params
+
+
+class FaissVectorStore(VectorStore):
+    """
+    Example store backed by FAISS index shards and a SQLite table.
+
+    Vectors live in <persist_directory>/<collection_name>.shards/, one exact L2
+    index (IndexIDMap2 over IndexFlatL2) per shard file, each memory-mapped on
+    load so queries page vectors in from disk instead of holding them on the
+    heap; a query searches every shard and keeps the overall nearest hits.
+    The FAISS ids are the rowids of the examples table in
+    <persist_directory>/<collection_name>.db, which holds each document, its
+    metadata and its shard; the shards table is the list of live shard files.
+    Scores are squared L2 distances (lower is more similar), the same as the
+    Chroma stores, so callers' thresholds apply to both backends.
+
+    Writes never copy existing vectors: an add writes its batch as a new shard
+    and a delete only records the ids in the deleted table, which searches
+    skip. Deleted vectors are dropped from disk when their shard is merged
+    (see FAISS_MAX_SHARDS), when it holds no live example any more, or by
+    utils.vector_stores.compact_vector_store().
+    """
+
+    def __init__(self, embedding_function=None, persist_directory: str = ".", collection_name: str = "examples",
+                 max_shards: int = FAISS_MAX_SHARDS):
+        self.embedding_function = embedding_function
+        os.makedirs(persist_directory, exist_ok=True)
+        self.shard_dir = os.path.join(persist_directory, f"{collection_name}.shards")
+        self.db_path = os.path.join(persist_directory, f"{collection_name}.db")
+        self.max_shards = max_shards
+        self._lock = threading.RLock()
+        self._shards = {}  # shard file name -> memory-mapped index
+        self._deleted = np.empty(0, dtype="int64")
+        self.init_db()
+        self._load_shards()
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def init_db(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS examples (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                document TEXT NOT NULL,
+                metadata TEXT,
+                shard TEXT
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS shards (name TEXT PRIMARY KEY, size INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS deleted (id INTEGER PRIMARY KEY, shard TEXT NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_examples_shard ON examples (shard)")
+        for key in INDEXED_METADATA:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_examples_{key} ON examples (json_extract(metadata, '$.{key}'))")
+        conn.commit()
+        conn.close()
+
+    def _load_shards(self):
+        conn = sqlite3.connect(self.db_path)
+        names = [name for (name,) in conn.execute("SELECT name FROM shards ORDER BY name")]
+        deleted = [i for (i,) in conn.execute("SELECT id FROM deleted")]
+        conn.close()
+        with self._lock:
+            self._shards = {name: self._read_shard(name) for name in names}
+            self._deleted = np.asarray(deleted, dtype="int64")
+
+    def _read_shard(self, name: str):
+        path = os.path.join(self.shard_dir, name)
+        try:
+            return faiss.read_index(path, _mmap_flags())
+        except RuntimeError:
+            return faiss.read_index(path)
+
+    @staticmethod
+    def _next_shard_name(conn) -> str:
+        numbers = [int(name.split(".")[0]) for (name,) in conn.execute("SELECT name FROM shards")]
+        return f"{max(numbers, default=0) + 1}.faiss"
+
+    def _write_shard(self, conn, index) -> str:
+        """Write index as a new shard file (atomically) and return its name; registered by the caller's commit."""
+        os.makedirs(self.shard_dir, exist_ok=True)
+        name = self._next_shard_name(conn)
+        path = os.path.join(self.shard_dir, name)
+        faiss.write_index(index, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return name
+
+    def add_embeddings(self, texts: list, embeddings: list, metadatas: list = None) -> list:
+        """Add texts with precomputed embeddings as a new shard; returns their ids as strings."""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [None] * len(texts)
+        vectors = np.asarray(embeddings, dtype="float32")
+
+        with self._lock:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            name = self._next_shard_name(conn)
+            ids = []
+            for text, metadata in zip(texts, metadatas):
+                cursor.execute(
+                    "INSERT INTO examples (document, metadata, shard) VALUES (?, ?, ?)",
+                    (text, json.dumps(metadata) if metadata else None, name)
+                )
+                ids.append(cursor.lastrowid)
+
+            index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+            index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+            # The file is in place before the rows that point at it are committed
+            self._write_shard(conn, index)
+            cursor.execute("INSERT INTO shards (name, size) VALUES (?, ?)", (name, len(ids)))
+            conn.commit()
+            self._shards[name] = self._read_shard(name)
+            if len(self._shards) > self.max_shards:
+                self._merge_smallest_shards(conn)
+            conn.close()
+        return [str(i) for i in ids]
+
+    def _merge_smallest_shards(self, conn):
+        """Merge the smallest shards into one (dropping deleted vectors), leaving max_shards // 2 + 1 shards."""
+        sizes = dict(conn.execute("SELECT name, size FROM shards"))
+        merged_names = sorted(sizes, key=lambda name: (sizes[name], name))[:len(sizes) - self.max_shards // 2]
+        placeholders = ",".join("?" for _ in merged_names)
+        deleted = np.asarray([i for (i,) in conn.execute(
+            f"SELECT id FROM deleted WHERE shard IN ({placeholders})", merged_names)], dtype="int64")
+
+        merged = None
+        for name in merged_names:
+            shard = self._shards[name]
+            ids = faiss.vector_to_array(shard.id_map).astype("int64")
+            vectors = shard.index.reconstruct_n(0, shard.ntotal)
+            keep = ~np.isin(ids, deleted)
+            if merged is None:
+                merged = faiss.IndexIDMap2(faiss.IndexFlatL2(shard.d))
+            merged.add_with_ids(vectors[keep], ids[keep])
+
+        name = self._write_shard(conn, merged)
+        conn.execute(f"UPDATE examples SET shard = ? WHERE shard IN ({placeholders})", [name] + merged_names)
+        conn.execute(f"DELETE FROM deleted WHERE shard IN ({placeholders})", merged_names)
+        conn.execute(f"DELETE FROM shards WHERE name IN ({placeholders})", merged_names)
+        conn.execute("INSERT INTO shards (name, size) VALUES (?, ?)", (name, merged.ntotal))
+        conn.commit()
+        self._shards[name] = self._read_shard(name)
+        self._drop_shard_files(merged_names)
+        self._deleted = self._deleted[~np.isin(self._deleted, deleted)]
+
+    def _drop_shard_files(self, names: list):
+        for name in names:
+            self._shards.pop(name, None)
+            path = os.path.join(self.shard_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def get(self, ids=None, where: dict = None, include: list = None) -> dict:
+        """Examples by id and/or metadata filter, in the same shape as Chroma's get()."""
+        include = ["metadatas", "documents"] if include is None else include
+        sql, params = "SELECT id, document, metadata, shard FROM examples", []
+        conditions = []
+        if ids is not None:
+            conditions.append(f"id IN ({','.join('?' for _ in ids)})" if ids else "0")
+            params.extend(int(i) for i in ids)
+        if where:
+            where_sql, where_params = _where_sql(where)
+            conditions.append(where_sql)
+            params.extend(where_params)
+        if conditions:
+            sql += " WHERE " + " AND ".join(f"({c})" for c in conditions)
+
+        with self._lock:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute(sql + " ORDER BY id", params)
+            rows = cursor.fetchall()
+            conn.close()
+            embeddings = None
+            if "embeddings" in include:
+                embeddings = [self._shards[row[3]].reconstruct(row[0]).tolist() for row in rows]
+
+        result = {"ids": [str(row[0]) for row in rows]}
+        if "documents" in include:
+            result["documents"] = [row[1] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(row[2]) if row[2] else None for row in rows]
+        if embeddings is not None:
+            result["embeddings"] = embeddings
+        return result
+
+    def delete(self, ids=None, **kwargs):
+        """
+        Remove examples by id: their rows go and their ids are recorded as
+        deleted; a shard left without live examples is removed outright.
+        """
+        if not ids:
+            return False
+        int_ids = [int(i) for i in ids]
+        placeholders = ",".join("?" for _ in int_ids)
+        with self._lock:
+            conn = sqlite3.connect(self.db_path)
+            rows = conn.execute(f"SELECT id, shard FROM examples WHERE id IN ({placeholders})", int_ids).fetchall()
+            conn.execute(f"DELETE FROM examples WHERE id IN ({placeholders})", int_ids)
+            conn.executemany("INSERT OR IGNORE INTO deleted (id, shard) VALUES (?, ?)", rows)
+            emptied = [shard for shard in {shard for _, shard in rows}
+                       if not conn.execute("SELECT 1 FROM examples WHERE shard = ? LIMIT 1", (shard,)).fetchone()]
+            for shard in emptied:
+                conn.execute("DELETE FROM deleted WHERE shard = ?", (shard,))
+                conn.execute("DELETE FROM shards WHERE name = ?", (shard,))
+            conn.commit()
+            deleted = [i for (i,) in conn.execute("SELECT id FROM deleted")]
+            conn.close()
+            self._drop_shard_files(emptied)
+            self._deleted = np.asarray(deleted, dtype="int64")
+        return True
+
+    def delete_collection(self):
+        """Drop every example: the shard files and the SQLite tables."""
+        with self._lock:
+            shutil.rmtree(self.shard_dir, ignore_errors=True)
+            self._shards = {}
+            self._deleted = np.empty(0, dtype="int64")
+            conn = sqlite3.connect(self.db_path)
+            for table in ("examples", "shards", "deleted"):
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.commit()
+            conn.close()
+            self.init_db()
+
+    def rename_collection(self, collection_name: str):
+        """Move this collection's files to collection_name, replacing any collection stored there."""
+        directory = os.path.dirname(self.shard_dir)
+        shard_dir = os.path.join(directory, f"{collection_name}.shards")
+        db_path = os.path.join(directory, f"{collection_name}.db")
+        with self._lock:
+            os.replace(self.db_path, db_path)
+            shutil.rmtree(shard_dir, ignore_errors=True)
+            if os.path.exists(self.shard_dir):
+                os.replace(self.shard_dir, shard_dir)
+            self.shard_dir, self.db_path = shard_dir, db_path
+            self._load_shards()
+
+    def add_texts(self, texts, metadatas=None, **kwargs) -> list:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas)
+
+    def _search(self, embedding, k: int, filter: dict = None):
+        """
+        Return [(id, Document, squared L2 distance)] for the k nearest live
+        examples over all shards, restricted to examples whose metadata matches filter.
+        """
+        with self._lock:
+            shards = [shard for shard in self._shards.values() if shard.ntotal]
+            deleted = self._deleted
+        if not shards:
+            return []
+        query = np.asarray([embedding], dtype="float32")
+        selector = None
+        if filter:
+            allowed = np.asarray([int(i) for i in self.get(where=filter, include=[])["ids"]], dtype="int64")
+            if len(allowed) == 0:
+                return []
+            k = min(k, len(allowed))
+            selector = faiss.IDSelectorBatch(allowed)
+        elif len(deleted):
+            deleted_selector = faiss.IDSelectorBatch(deleted)  # kept referenced while searching
+            selector = faiss.IDSelectorNot(deleted_selector)
+
+        hits = []
+        for shard in shards:
+            if selector is not None:
+                distances, ids = shard.search(query, min(k, shard.ntotal), params=faiss.SearchParameters(sel=selector))
+            else:
+                distances, ids = shard.search(query, min(k, shard.ntotal))
+            hits.extend((int(i), float(d)) for i, d in zip(ids[0], distances[0]) if i != -1)
+        hits = sorted(hits, key=lambda hit: hit[1])[:k]
+        if not hits:
+            return []
+
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        placeholders = ",".join("?" for _ in hits)
+        cursor.execute(f"SELECT id, document, metadata FROM examples WHERE id IN ({placeholders})",
+                       [i for i, _ in hits])
+        rows = {row[0]: row for row in cursor.fetchall()}
+        conn.close()
+
+        results = []
+        for i, distance in hits:
+            if i in rows:
+                _, document, metadata = rows[i]
+                doc = Document(page_content=document, metadata=json.loads(metadata) if metadata else {})
+                results.append((i, doc, distance))
+        return results
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k: int = 4, filter: dict = None,
+                                                           **kwargs) -> list:
+        """Return (document, squared L2 distance) pairs for the k nearest examples."""
+        return [(doc, distance) for _, doc, distance in self._search(embedding, k, filter)]
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, filter: dict = None, **kwargs) -> list:
+        """Pick k of the fetch_k nearest examples, trading relevance for diversity (MMR)."""
+        candidates = self._search(embedding, fetch_k, filter)
+        if not candidates:
+            return []
+        stored = self.get(ids=[i for i, _, _ in candidates], include=["embeddings"])
+        by_id = dict(zip(stored["ids"], stored["embeddings"]))
+        candidates = [c for c in candidates if str(c[0]) in by_id]  # not deleted meanwhile
+        if not candidates:
+            return []
+        vectors = [by_id[str(i)] for i, _, _ in candidates]
+        selected = maximal_marginal_relevance(np.asarray(embedding, dtype="float32"), vectors,
+                                              lambda_mult=lambda_mult, k=k)
+        return [candidates[i][1] for i in selected]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, filter: dict = None, **kwargs) -> list:
+        return self.max_marginal_relevance_search_by_vector(self.embedding_function.embed_query(query), k,
+                                                            fetch_k, lambda_mult, filter)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict = None, **kwargs) -> list:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list:
+        return self.similarity_search_by_vector_with_relevance_scores(self.embedding_function.embed_query(query), k,
+                                                                      filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        store = cls(embedding_function=embedding, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
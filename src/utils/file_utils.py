@@ -1,4 +1,5 @@
 import tempfile, os
+import io
 
 def save_temp_file(uploaded_file, suffix):
     """Save an uploaded file to a temporary file and return its path."""
@@ -8,4 +9,22 @@ def save_temp_file(uploaded_file, suffix):
     
 def remove_temp_file(file_path):
     if os.path.exists(file_path):
-        os.unlink(file_path)
\ No newline at end of file
+        os.unlink(file_path)
+
+
+def is_buffer(source):
+    """True if source is an in-memory document (bytes, bytearray or memoryview) rather than a path."""
+    return isinstance(source, (bytes, bytearray, memoryview))
+
+
+def read_bytes(source):
+    """Return the document contents: buffers are returned as-is, paths are read once."""
+    if is_buffer(source):
+        return source
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def as_file(source):
+    """Return something parsers can open: a BytesIO over a buffer, or the path itself."""
+    return io.BytesIO(source) if is_buffer(source) else source
@@ -0,0 +1,71 @@
+# utils/llm_cache.py
+
+import os
+import json
+import hashlib
+import threading
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+from utils.cache import SQLiteCache
+
+# Responses of deterministic (temperature 0) LLM calls are cached on disk,
+# keyed by the model configuration (model name, temperature and the other
+# request parameters) and a hash of the prompt. Set LLM_CACHE_ENABLED=0 to
+# always call the API.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH") or "llm_cache.db"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES") or 5000)
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES") or 64 * 1024 * 1024)
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL") or 7 * 24 * 3600)
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+class LLMResponseCache(BaseCache):
+    """
+    LangChain response cache backed by a SQLiteCache (TTL and LRU size
+    limits). Pass it as ChatOpenAI(cache=...) and every invoke/batch/chain call
+    on that model is served from disk when the same prompt was already sent
+    with the same configuration.
+    """
+
+    def __init__(self, cache: SQLiteCache = None):
+        self.cache = cache or SQLiteCache(LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES,
+                                          max_bytes=LLM_CACHE_MAX_BYTES, ttl=LLM_CACHE_TTL)
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        model_hash = hashlib.sha256(llm_string.encode("utf-8")).hexdigest()
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return f"{model_hash}:{prompt_hash}"
+
+    def lookup(self, prompt: str, llm_string: str):
+        value = self.cache.get(self._key(prompt, llm_string))
+        if value is None:
+            return None
+        return [loads(generation) for generation in json.loads(value)]
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        value = json.dumps([dumps(generation) for generation in return_val])
+        self.cache.set(self._key(prompt, llm_string), value)
+
+    def clear(self, **kwargs) -> None:
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counts of this process."""
+        return {"hits": self.cache.hits, "misses": self.cache.misses}
+
+
+def get_llm_cache():
+    """Returns the process-wide LLM response cache, or None when LLM_CACHE_ENABLED is off."""
+    global _llm_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMResponseCache()
+        return _llm_cache
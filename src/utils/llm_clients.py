@@ -0,0 +1,62 @@
+# utils/llm_clients.py
+
+import threading
+
+from utils.concurrency import wait_for_openai_quota
+from utils.llm_cache import get_llm_cache
+
+# Chat models are created on first use and shared by every validator,
+# comparator and chatbot call in the process. A ChatOpenAI client is
+# thread-safe and keeps its HTTP connection pool (keep-alive) between calls,
+# so sharing one avoids per-document client setup and TLS handshakes.
+DEFAULT_CHAT_MODEL = "gpt-3.5-turbo"
+
+_chat_models = {}
+_chat_models_lock = threading.Lock()
+# Prompt size of the invoke_with_quota() call running on this thread.
+_quota_call = threading.local()
+
+
+class QuotaChargedMixin:
+    """
+    Chat model mixin that waits for the shared OpenAI quota in _generate.
+    LangChain reaches _generate only when the response cache misses, so
+    cached replays are never charged.
+    """
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        wait_for_openai_quota(getattr(_quota_call, "prompt_tokens", 0))
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+def get_chat_model(model_name: str = DEFAULT_CHAT_MODEL, temperature: float = 0):
+    """
+    Return the process-wide ChatOpenAI client for this model and temperature.
+    Temperature 0 clients answer from the LLM response cache when possible.
+    """
+    key = (model_name, temperature)
+    with _chat_models_lock:
+        llm = _chat_models.get(key)
+        if llm is None:
+            from langchain_openai import ChatOpenAI
+
+            class QuotaChargedChatOpenAI(QuotaChargedMixin, ChatOpenAI):
+                pass
+
+            # Only deterministic calls are worth replaying from the response cache
+            cache = get_llm_cache() if temperature == 0 else None
+            llm = QuotaChargedChatOpenAI(model_name=model_name, temperature=temperature, cache=cache)
+            _chat_models[key] = llm
+        return llm
+
+
+def invoke_with_quota(llm, prompt: str, prompt_tokens: int):
+    """
+    llm.invoke(prompt), charging prompt_tokens to the shared OpenAI quota if
+    the call reaches the API (see QuotaChargedMixin).
+    """
+    _quota_call.prompt_tokens = prompt_tokens
+    try:
+        return llm.invoke(prompt)
+    finally:
+        _quota_call.prompt_tokens = 0
@@ -0,0 +1,229 @@
+# utils/ocr.py
+
+import os
+import atexit
+import hashlib
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import pymupdf
+import pytesseract
+from PIL import Image
+
+from utils.cache import SQLiteCache
+from utils.file_utils import is_buffer
+
+# Resolution used when a PDF page has no text layer and must be OCR'd.
+OCR_DPI = 300
+
+# Number of processes used to OCR scanned PDF pages in parallel.
+# Set OCR_WORKERS=1 to OCR pages sequentially in the calling process.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS") or os.cpu_count() or 1)
+
+# Tesseract config passed to every OCR call; part of the OCR cache key.
+OCR_CONFIG = ""
+
+# Adaptive mode: scanned pages are first OCR'd at OCR_COARSE_DPI and only
+# re-rendered at OCR_DPI when the mean word confidence is below
+# OCR_MIN_CONFIDENCE or fewer than OCR_MIN_KEYWORD_HITS document keywords
+# were recognised on the page.
+OCR_ADAPTIVE_DPI = os.getenv("OCR_ADAPTIVE_DPI", "").lower() in ("1", "true", "yes")
+OCR_COARSE_DPI = int(os.getenv("OCR_COARSE_DPI") or 150)
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE") or 80)
+OCR_MIN_KEYWORD_HITS = int(os.getenv("OCR_MIN_KEYWORD_HITS") or 1)
+
+# OCR results are cached on disk by page image content, so repeated pages
+# (vendor templates, cover sheets) are only OCR'd once.
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH") or "ocr_cache.db"
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES") or 64 * 1024 * 1024)
+
+_pool = None
+_pool_lock = threading.Lock()
+_ocr_cache = None
+_ocr_cache_lock = threading.Lock()
+
+
+def open_pdf(source):
+    """Open a PDF from a path or from an in-memory buffer without touching disk."""
+    if is_buffer(source):
+        if isinstance(source, memoryview):
+            source = source.tobytes()
+        return pymupdf.open(stream=source, filetype="pdf")
+    return pymupdf.open(source)
+
+
+def _ocr_pixmap(width: int, height: int, samples: bytes) -> str:
+    """Runs Tesseract on raw RGB pixmap samples (executed inside pool workers)."""
+    img = Image.frombytes("RGB", [width, height], samples)
+    return pytesseract.image_to_string(img, config=OCR_CONFIG)
+
+
+def _ocr_pixmap_data(width: int, height: int, samples: bytes) -> tuple:
+    """
+    Runs Tesseract's image_to_data on raw RGB pixmap samples (executed inside
+    pool workers). Returns the recognised text, one line per OCR line, and the
+    mean confidence of the recognised words (0 when there are none).
+    """
+    img = Image.frombytes("RGB", [width, height], samples)
+    data = pytesseract.image_to_data(img, config=OCR_CONFIG, output_type=pytesseract.Output.DICT)
+    lines = []
+    confidences = []
+    current_line = None
+    for word, conf, block, par, line in zip(data["text"], data["conf"], data["block_num"],
+                                            data["par_num"], data["line_num"]):
+        word = word.strip()
+        if not word or float(conf) < 0:
+            continue
+        confidences.append(float(conf))
+        if (block, par, line) != current_line:
+            if current_line is not None and current_line[:2] != (block, par):
+                lines.append("")
+            lines.append(word)
+            current_line = (block, par, line)
+        else:
+            lines[-1] += " " + word
+    mean_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return "\n".join(lines), mean_confidence
+
+
+@lru_cache(maxsize=1)
+def get_tesseract_version() -> str:
+    return str(pytesseract.get_tesseract_version())
+
+
+def get_ocr_cache() -> SQLiteCache:
+    """Returns the on-disk OCR cache, creating it on first use."""
+    global _ocr_cache
+    with _ocr_cache_lock:
+        if _ocr_cache is None:
+            _ocr_cache = SQLiteCache(OCR_CACHE_PATH, max_bytes=OCR_CACHE_MAX_BYTES)
+        return _ocr_cache
+
+
+def ocr_cache_key(width: int, height: int, samples: bytes, mode: str = "string") -> str:
+    """Content hash of a rendered page plus the Tesseract version, config and call used to read it."""
+    digest = hashlib.sha256()
+    digest.update(f"{mode}|{width}x{height}|{get_tesseract_version()}|{OCR_CONFIG}|".encode("utf-8"))
+    digest.update(samples)
+    return digest.hexdigest()
+
+
+def get_ocr_pool() -> ProcessPoolExecutor:
+    """Returns the process pool shared by all PDF extractions, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+            atexit.register(_pool.shutdown, wait=False)
+        return _pool
+
+
+def _ocr_pages(doc, indexes: list, dpi: int, mode: str) -> dict:
+    """
+    Renders the given pages at dpi and OCRs them, returning {page index: result}.
+    mode "string" yields the page text, mode "data" yields (text, mean confidence).
+    Cached results are reused; the rest run on the shared process pool with at
+    most two rendered pages per worker in flight, which bounds memory use on
+    long scans.
+    """
+    worker = _ocr_pixmap_data if mode == "data" else _ocr_pixmap
+    cache = get_ocr_cache()
+    results = {}
+    pending = []  # (page index, cache key, future), oldest first
+
+    def store(index, cache_key, result):
+        results[index] = result
+        cache.set(cache_key, json.dumps(result) if mode == "data" else result)
+
+    for index in indexes:
+        pix = doc[index].get_pixmap(dpi=dpi)
+        samples = pix.samples
+        cache_key = ocr_cache_key(pix.width, pix.height, samples, mode)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            results[index] = tuple(json.loads(cached)) if mode == "data" else cached
+            continue
+
+        if OCR_WORKERS <= 1:
+            store(index, cache_key, worker(pix.width, pix.height, samples))
+            continue
+
+        if len(pending) >= 2 * OCR_WORKERS:
+            done_index, done_key, future = pending.pop(0)
+            store(done_index, done_key, future.result())
+        pending.append((index, cache_key, get_ocr_pool().submit(worker, pix.width, pix.height, samples)))
+
+    for index, cache_key, future in pending:
+        store(index, cache_key, future.result())
+    return results
+
+
+def is_confident_ocr(text: str, confidence: float, keywords: list = None) -> bool:
+    """True when a coarse OCR pass is good enough to skip the full-resolution pass."""
+    if confidence < OCR_MIN_CONFIDENCE:
+        return False
+    if keywords:
+        text_lower = text.lower()
+        hits = sum(1 for keyword in keywords if keyword in text_lower)
+        if hits < OCR_MIN_KEYWORD_HITS:
+            return False
+    return True
+
+
+def _extract_page_range(doc, indexes: list, keywords: list = None) -> list:
+    """Returns the text of the given pages, in order (see extract_pdf_pages)."""
+    pages = {}
+    scanned = []
+    for index in indexes:
+        page_text = doc[index].get_text().strip()
+        pages[index] = page_text
+        if not page_text:
+            scanned.append(index)
+
+    if OCR_ADAPTIVE_DPI and scanned:
+        coarse_results = _ocr_pages(doc, scanned, OCR_COARSE_DPI, "data")
+        scanned = []
+        for index, (text, confidence) in sorted(coarse_results.items()):
+            if is_confident_ocr(text, confidence, keywords):
+                pages[index] = text
+            else:
+                scanned.append(index)
+
+    pages.update(_ocr_pages(doc, scanned, OCR_DPI, "string"))
+    return [pages[index] for index in indexes]
+
+
+def iter_pdf_pages(doc, keywords: list = None, first_pages: int = 2):
+    """
+    Yields the text of each page of an open PyMuPDF document, in page order.
+    The first first_pages pages are extracted on their own before the rest,
+    so a caller that stops iterating after them never pays for the remaining
+    pages' OCR.
+    """
+    indexes = list(range(len(doc)))
+    for chunk in (indexes[:first_pages], indexes[first_pages:]):
+        yield from _extract_page_range(doc, chunk, keywords)
+
+
+def extract_pdf_pages(doc, keywords: list = None) -> list:
+    """
+    Returns the text of every page of an open PyMuPDF document, in page order.
+    Pages with a text layer are read in-process with get_text(); pages without
+    one are OCR'd at OCR_DPI. With OCR_ADAPTIVE_DPI enabled they are first OCR'd
+    at OCR_COARSE_DPI, and only pages whose confidence or keyword hits (from
+    keywords) fall short are re-rendered at OCR_DPI.
+    """
+    return _extract_page_range(doc, list(range(len(doc))), keywords)
+
+
+def ocr_image(img) -> str:
+    """OCRs a PIL image (e.g. an uploaded PNG/JPG), reusing the cached text for identical images."""
+    cache = get_ocr_cache()
+    cache_key = ocr_cache_key(img.width, img.height, img.mode.encode("utf-8") + img.tobytes())
+    text = cache.get(cache_key)
+    if text is None:
+        text = pytesseract.image_to_string(img, config=OCR_CONFIG)
+        cache.set(cache_key, text)
+    return text
@@ -1,22 +1,293 @@
 # utils/vector_stores.py
 
-from langchain_openai import OpenAIEmbeddings
-#from langchain.vectorstores import Chroma
-from langchain_community.vectorstores import Chroma
-
-# Initialize the embeddings only once.
-embeddings = OpenAIEmbeddings()
-
-# Initialize the vector store for invoices.
-invoice_vectorstore = Chroma(
-    persist_directory="invoice_db",
-    embedding_function=embeddings,
-    collection_name="invoices"
-)
-
-# Initialize the vector store for purchase orders.
-po_vectorstore = Chroma(
-    persist_directory="po_db",
-    embedding_function=embeddings,
-    collection_name="purchase_orders"
-)
+import os
+import atexit
+import hashlib
+import threading
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Vector stores and the embeddings client are created on first use (not at
+# import) and then shared by every session in the process.
+# VECTOR_BACKEND selects the store implementation: "chroma" (default) or
+# "faiss" (memory-mapped FAISS index + SQLite, see utils.faiss_store).
+VECTOR_BACKEND = (os.getenv("VECTOR_BACKEND") or "chroma").lower()
+VECTOR_STORES = {
+    "invoices": {"persist_directory": "invoice_db", "collection_name": "invoices"},
+    "purchase_orders": {"persist_directory": "po_db", "collection_name": "purchase_orders"},
+}
+
+# Validated examples are written behind: buffered, embedded in one
+# embed_documents call and persisted once per batch. A batch is flushed when
+# it holds VECTOR_WRITE_BATCH_SIZE examples, VECTOR_WRITE_MAX_DELAY seconds
+# after its first example, and at interpreter shutdown.
+VECTOR_WRITE_BATCH_SIZE = int(os.getenv("VECTOR_WRITE_BATCH_SIZE") or 32)
+VECTOR_WRITE_MAX_DELAY = float(os.getenv("VECTOR_WRITE_MAX_DELAY") or 5)
+
+# Retention: examples carrying a "content_hash" are stored once, and only the
+# newest EXAMPLES_PER_SUPPLIER examples per "supplier" metadata value are kept
+# (0 disables the cap). compact_vector_store() applies the same policy offline.
+EXAMPLES_PER_SUPPLIER = int(os.getenv("EXAMPLES_PER_SUPPLIER") or 50)
+VECTOR_REBUILD_BATCH_SIZE = 5000
+
+_lock = threading.RLock()
+_embeddings = None
+_vector_stores = {}
+_writers = {}
+
+
+def get_embeddings():
+    """Return the process-wide embeddings client (OpenAI behind the on-disk embedding cache)."""
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                from langchain_openai import OpenAIEmbeddings
+                from utils.embeddings import CachedEmbeddings
+                _embeddings = CachedEmbeddings(OpenAIEmbeddings())
+    return _embeddings
+
+
+def get_vector_store(name: str):
+    """Return the process-wide vector store for a VECTOR_STORES entry, opening it on first use."""
+    store = _vector_stores.get(name)
+    if store is None:
+        with _lock:
+            store = _vector_stores.get(name)
+            if store is None:
+                store = _open_vector_store(name)
+                _vector_stores[name] = store
+    return store
+
+
+def _open_vector_store(name: str, collection_name: str = None):
+    config = dict(VECTOR_STORES[name])
+    if collection_name:
+        config["collection_name"] = collection_name
+    if VECTOR_BACKEND == "faiss":
+        from utils.faiss_store import FaissVectorStore
+        return FaissVectorStore(embedding_function=get_embeddings(), **config)
+    if VECTOR_BACKEND != "chroma":
+        raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+    from langchain_community.vectorstores import Chroma
+    return Chroma(embedding_function=get_embeddings(), **config)
+
+
+def get_invoice_vectorstore():
+    return get_vector_store("invoices")
+
+
+def get_po_vectorstore():
+    return get_vector_store("purchase_orders")
+
+
+def add_texts_with_embeddings(vector_store, texts, embeddings, metadatas=None):
+    """
+    Add texts whose embeddings were already computed (e.g. the query vector
+    used for retrieval), skipping the embedding call add_texts() would make.
+    """
+    if hasattr(vector_store, "add_embeddings"):
+        return vector_store.add_embeddings(texts, embeddings, metadatas)
+    ids = [str(uuid.uuid4()) for _ in texts]
+    vector_store._collection.upsert(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+    return ids
+
+
+class VectorStoreWriter:
+    """
+    Write-behind buffer for one vector store.
+
+    add() only queues an example; flush() drops examples whose content_hash
+    is already stored (or repeated in the batch), embeds every remaining text
+    that has no precomputed embedding in a single embed_documents call,
+    upserts the batch, trims each affected supplier to max_per_supplier
+    examples and persists once. Queued examples are not visible to retrieval
+    until they are flushed. A batch that fails to write goes back on the queue
+    and is retried by the next flush (after max_delay seconds at the latest).
+    """
+
+    def __init__(self, vector_store, embeddings=None, batch_size: int = VECTOR_WRITE_BATCH_SIZE,
+                 max_delay: float = VECTOR_WRITE_MAX_DELAY, max_per_supplier: int = EXAMPLES_PER_SUPPLIER):
+        self.vector_store = vector_store
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_per_supplier = max_per_supplier
+        self._pending = []  # (text, embedding or None, metadata or None)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def add(self, text: str, embedding=None, metadata: dict = None):
+        with self._lock:
+            self._pending.append((text, embedding, metadata))
+            full = len(self._pending) >= self.batch_size
+            if not full:
+                self._schedule_flush()
+        if full:
+            self._flush_logged()
+
+    def _schedule_flush(self):
+        # Called with self._lock held
+        if self._timer is None and self.max_delay > 0:
+            self._timer = threading.Timer(self.max_delay, self._flush_logged)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_logged(self):
+        """flush() for callers with no one to report to (timer, batch-full add): failures are logged."""
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Vector store write failed; %d examples queued for retry", len(self._pending))
+
+    def flush(self) -> int:
+        """
+        Write every queued example now; returns how many were written. On
+        failure the examples are put back on the queue and the error is raised.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            try:
+                return self._write(batch)
+            except Exception:
+                with self._lock:
+                    # Already stored examples of a partly written batch are dropped as duplicates on retry
+                    self._pending[:0] = batch
+                    self._schedule_flush()
+                raise
+
+    def _write(self, batch: list) -> int:
+        batch = self._drop_stored_duplicates(batch)
+        if not batch:
+            return 0
+
+        texts = [text for text, _, _ in batch]
+        vectors = [embedding for _, embedding, _ in batch]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            embeddings = self.embeddings or get_embeddings()
+            for i, vector in zip(missing, embeddings.embed_documents([texts[i] for i in missing])):
+                vectors[i] = vector
+        metadatas = [metadata for _, _, metadata in batch]
+        add_texts_with_embeddings(self.vector_store, texts, vectors,
+                                  metadatas if any(metadatas) else None)
+        if self.max_per_supplier:
+            # Examples without a known supplier are not one supplier's examples: never capped
+            for supplier in {m["supplier"] for m in metadatas if m and m.get("supplier")}:
+                self._trim_supplier(supplier)
+        if hasattr(self.vector_store, "persist"):
+            self.vector_store.persist()
+        return len(batch)
+
+    def _drop_stored_duplicates(self, batch: list) -> list:
+        hashes = [m["content_hash"] for _, _, m in batch if m and "content_hash" in m]
+        if not hashes:
+            return batch
+        stored = self.vector_store.get(where={"content_hash": {"$in": hashes}}, include=["metadatas"])
+        seen = {m["content_hash"] for m in stored["metadatas"] if m}
+        unique = []
+        for text, embedding, metadata in batch:
+            content_hash = metadata.get("content_hash") if metadata else None
+            if content_hash in seen:
+                continue
+            if content_hash:
+                seen.add(content_hash)
+            unique.append((text, embedding, metadata))
+        return unique
+
+    def _trim_supplier(self, supplier: str):
+        stored = self.vector_store.get(where={"supplier": supplier}, include=["metadatas"])
+        if len(stored["ids"]) <= self.max_per_supplier:
+            return
+        entries = sorted(zip(stored["ids"], stored["metadatas"]),
+                         key=lambda entry: (entry[1] or {}).get("created_at", 0), reverse=True)
+        self.vector_store.delete(ids=[i for i, _ in entries[self.max_per_supplier:]])
+
+
+def get_vector_store_writer(name: str) -> VectorStoreWriter:
+    """Return the process-wide write-behind buffer for a VECTOR_STORES entry."""
+    with _lock:
+        writer = _writers.get(name)
+        if writer is None:
+            writer = VectorStoreWriter(get_vector_store(name))
+            _writers[name] = writer
+        return writer
+
+
+def flush_vector_writes():
+    """Flush every write-behind buffer (also run at interpreter shutdown)."""
+    with _lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer._flush_logged()
+
+
+atexit.register(flush_vector_writes)
+
+
+def compact_vector_store(name: str, max_per_supplier: int = EXAMPLES_PER_SUPPLIER) -> tuple:
+    """
+    Rebuild a VECTOR_STORES collection without redundant examples: one example
+    per content hash (hashing the stored text for examples saved without one)
+    and at most max_per_supplier per supplier, newest first (examples without a
+    supplier are not capped). Stored vectors are reused, so no embedding calls
+    are made. Returns (examples before, after).
+
+    The kept examples are written to a staging collection ("<collection>_compact")
+    first; only once it is complete is the original collection dropped and the
+    staging collection renamed in its place. A failure while building leaves the
+    original untouched; one during the swap leaves the examples in the staging
+    collection.
+    """
+    get_vector_store_writer(name).flush()
+    store = get_vector_store(name)
+    data = store.get(include=["documents", "metadatas", "embeddings"])
+    entries = list(zip(data["documents"], data["metadatas"], data["embeddings"]))
+    before = len(entries)
+
+    # Newest first; examples without created_at keep their stored order, after the dated ones.
+    order = sorted(range(before), key=lambda i: ((entries[i][1] or {}).get("created_at", 0), i), reverse=True)
+    kept, hashes, per_supplier = [], set(), {}
+    for i in order:
+        document, metadata, embedding = entries[i]
+        metadata = dict(metadata or {})
+        content_hash = metadata.get("content_hash") or hashlib.sha256(document.encode("utf-8")).hexdigest()
+        supplier = metadata.get("supplier", "")
+        if content_hash in hashes:
+            continue
+        if supplier and max_per_supplier and per_supplier.get(supplier, 0) >= max_per_supplier:
+            continue
+        hashes.add(content_hash)
+        if supplier:
+            per_supplier[supplier] = per_supplier.get(supplier, 0) + 1
+        metadata["content_hash"] = content_hash
+        kept.append((document, metadata, list(embedding)))
+    kept.reverse()  # re-insert oldest first
+
+    collection_name = VECTOR_STORES[name]["collection_name"]
+    staging = _open_vector_store(name, f"{collection_name}_compact")
+    staging.delete_collection()  # leftovers of an interrupted run
+    staging = _open_vector_store(name, f"{collection_name}_compact")
+    for start in range(0, len(kept), VECTOR_REBUILD_BATCH_SIZE):
+        chunk = kept[start:start + VECTOR_REBUILD_BATCH_SIZE]
+        add_texts_with_embeddings(staging, [d for d, _, _ in chunk], [e for _, _, e in chunk],
+                                  [m for _, m, _ in chunk])
+    if hasattr(staging, "persist"):
+        staging.persist()
+
+    with _lock:
+        store.delete_collection()
+        if hasattr(staging, "rename_collection"):
+            staging.rename_collection(collection_name)
+        else:
+            staging._collection.modify(name=collection_name)
+        _vector_stores.pop(name, None)
+        _writers.pop(name, None)
+    return before, len(kept)
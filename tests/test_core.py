@@ -1,4 +1,5 @@
 import os
+import json
 import pytest
 from src.core.validation_engine import InvoiceValidationService
 
@@ -6,3 +7,275 @@ def test_validation_service_with_invalid_file():
     service = InvoiceValidationService()
     with pytest.raises(ValueError):
         service.validate("nonexistent_file.txt", "txt")
+
+def test_validation_service_reuses_validator_instances():
+    class FakeValidator:
+        created = 0
+
+        def __init__(self):
+            FakeValidator.created += 1
+
+    service = InvoiceValidationService()
+    service.validators = {"png": FakeValidator, "jpg": FakeValidator}
+    assert service.get_validator("PNG") is service.get_validator("jpg")
+    assert FakeValidator.created == 1
+
+def test_invoice_validator_reuses_cached_result_for_same_file(tmp_path, monkeypatch):
+    from langchain_core.messages import AIMessage
+    from src.core import file_validator
+    from src.utils.db import DatabaseManager
+
+    monkeypatch.setattr(DatabaseManager, "DB_PATH", str(tmp_path / "invoices.db"))
+    DatabaseManager()
+    text = "INVOICE INV-9\nInvoice date 2024-01-05\nSupplier Acme\nWidget 2 x $5.00\nSubtotal $10.00\nTotal due $10.00"
+    response = json.dumps({
+        "validation": {"valid_format": True, "missing_fields": [], "anomalies": []},
+        "extracted_fields": {"invoice_number": "INV-9", "invoice_date": "2024-01-05", "total_amount": "$10.00",
+                             "line_items": [{"description": "Widget", "quantity": 2, "unit_price": 5, "amount": 10}]},
+    })
+    calls = []
+    monkeypatch.setattr(file_validator, "invoke_with_quota", lambda *args: calls.append(args) or AIMessage(response))
+
+    class TextInvoiceValidator(file_validator.InvoiceValidator):
+        vector_store = None  # vector search errors are reported as anomalies
+
+        def extract_text(self, source):
+            return text
+
+        def read_document(self, source):
+            return text, True
+
+        def build_rag_prompt(self, invoice_text, **kwargs):
+            return invoice_text
+
+        def store_invoice_context(self, *args):
+            pass
+
+    validator = TextInvoiceValidator.__new__(TextInvoiceValidator)
+    validator.llm, validator.prompt_hash, validator.model_version = None, "prompt", "model"
+
+    first = validator.validate_invoice(b"invoice bytes")
+    assert first["is_valid_format"] and len(calls) == 1
+    second = validator.validate_invoice(b"invoice bytes")
+    assert len(calls) == 1
+    assert second["extracted_fields"] == first["extracted_fields"] and second["is_duplicate"]
+
+    # Results from an older extractor are not served
+    monkeypatch.setattr(file_validator, "EXTRACTOR_VERSION", "test")
+    validator.validate_invoice(b"invoice bytes")
+    assert len(calls) == 2
+
+def test_map_csv_fields_maps_header_synonyms_and_line_items():
+    import pandas as pd
+    from src.core.field_mapping import map_csv_fields
+
+    df = pd.DataFrame({
+        "Invoice #": ["INV-1", "INV-1"],
+        "Date": ["2024-01-05", "2024-01-05"],
+        "Vendor": ["Acme", "Acme"],
+        "Item": ["Bolts", "Nuts"],
+        "Qty": ["2", "3"],
+        "Unit Price": ["1.00", "2.00"],
+        "Amount": ["2.00", "6.00"],
+        "Total": ["8.00", "8.00"],
+    })
+    result = map_csv_fields(df, ["invoice_number", "invoice_date", "total_amount", "line_items"], ["supplier_name"])
+    fields = result["extracted_fields"]
+    assert fields["invoice_number"] == "INV-1"
+    assert fields["supplier_name"] == "Acme"
+    assert fields["total_amount"] == "8.00"
+    assert fields["line_items"][1] == {"description": "Nuts", "quantity": "3", "unit_price": "2.00", "amount": "6.00"}
+
+
+def test_map_csv_fields_requires_document_identifier():
+    import pandas as pd
+    from src.core.data_processor import InvoiceValidator
+    from src.core.field_mapping import map_csv_fields
+
+    # A purchase order export: most invoice fields map, but there is no invoice number
+    df = pd.DataFrame({
+        "PO Number": ["PO-9", "PO-9"],
+        "Date": ["2024-01-05", "2024-01-05"],
+        "Vendor": ["Acme", "Acme"],
+        "Item": ["Bolts", "Nuts"],
+        "Qty": ["2", "3"],
+        "Price": ["1.00", "2.00"],
+        "Amount": ["2.00", "6.00"],
+        "Total": ["8.00", "8.00"],
+    })
+    assert map_csv_fields(df, InvoiceValidator.MANDATORY_FIELDS, InvoiceValidator.OPTIONAL_FIELDS) is None
+
+def test_map_csv_fields_never_maps_varying_columns_to_header_fields():
+    import pandas as pd
+    from src.core.data_processor import InvoiceValidator
+    from src.core.field_mapping import map_csv_fields
+
+    mandatory, optional = InvoiceValidator.MANDATORY_FIELDS, InvoiceValidator.OPTIONAL_FIELDS
+    # "Total" is a per-line total here, not the invoice total
+    single = pd.DataFrame({
+        "Invoice #": ["INV-1", "INV-1"],
+        "Date": ["2024-01-05", "2024-01-05"],
+        "Item": ["Bolts", "Nuts"],
+        "Amount": ["2.00", "6.00"],
+        "Total": ["2.20", "6.60"],
+    })
+    assert map_csv_fields(single, mandatory, optional) is None
+
+    # An export of several invoices is not one invoice
+    export = pd.DataFrame({
+        "Invoice #": ["INV-1", "INV-2", "INV-3"],
+        "Date": ["2024-01-05", "2024-01-06", "2024-01-07"],
+        "Item": ["Bolts", "Nuts", "Screws"],
+        "Qty": ["2", "3", "4"],
+        "Total": ["2.00", "6.00", "8.00"],
+    })
+    assert map_csv_fields(export, mandatory, optional) is None
+
+def test_parse_xml_maps_ubl_invoice():
+    import io
+    from src.core.xml_extractor import parse_xml
+
+    xml = b"""<Invoice xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
+        xmlns:cbc="urn:cbc" xmlns:cac="urn:cac">
+      <cbc:ID>INV-7</cbc:ID>
+      <cbc:IssueDate>2024-02-01</cbc:IssueDate>
+      <cac:LegalMonetaryTotal><cbc:PayableAmount currencyID="USD">30.00</cbc:PayableAmount></cac:LegalMonetaryTotal>
+      <cac:InvoiceLine>
+        <cbc:InvoicedQuantity>3</cbc:InvoicedQuantity>
+        <cbc:LineExtensionAmount>30.00</cbc:LineExtensionAmount>
+        <cac:Item><cbc:Name>Widget</cbc:Name></cac:Item>
+        <cac:Price><cbc:PriceAmount>10.00</cbc:PriceAmount></cac:Price>
+      </cac:InvoiceLine>
+    </Invoice>"""
+    text, fields, schema = parse_xml(io.BytesIO(xml))
+    assert schema == "ubl_invoice"
+    assert "LegalMonetaryTotal/PayableAmount: 30.00 [currencyID=USD]" in text
+    assert fields["invoice_number"] == "INV-7"
+    assert fields["total_amount"] == "30.00"
+    assert fields["line_items"] == [{"description": "Widget", "quantity": "3", "unit_price": "10.00", "amount": "30.00"}]
+
+def test_parse_xml_maps_cxml_order_header_before_request():
+    import io
+    from src.core.xml_extractor import parse_xml
+
+    xml = b"""<cXML payloadID="1" timestamp="2024-02-01">
+      <Header>
+        <From><Credential domain="DUNS"><Identity>Buyer Co</Identity></Credential></From>
+        <To><Credential domain="DUNS"><Identity>Acme Supplies</Identity></Credential></To>
+      </Header>
+      <Request>
+        <OrderRequest>
+          <OrderRequestHeader orderID="PO-42" orderDate="2024-02-01">
+            <Total><Money currency="USD">20.00</Money></Total>
+            <ShipTo><Address><Name>Warehouse</Name></Address></ShipTo>
+          </OrderRequestHeader>
+          <ItemOut quantity="2">
+            <ItemDetail><UnitPrice><Money currency="USD">10.00</Money></UnitPrice>
+              <Description>Widget</Description></ItemDetail>
+          </ItemOut>
+        </OrderRequest>
+      </Request>
+    </cXML>"""
+    text, fields, schema = parse_xml(io.BytesIO(xml))
+    assert schema == "cxml_order"
+    assert fields["supplier_name"] == "Acme Supplies"
+    assert fields["po_number"] == "PO-42"
+    assert fields["total"] == "20.00"
+    assert fields["line_items"] == [{"description": "Widget", "quantity": "2", "unit_price": "10.00", "amount": "N/A"}]
+
+def test_select_examples_respects_token_budget():
+    from types import SimpleNamespace
+    from src.core.rag_context import compact_example, count_tokens, select_examples
+
+    example = compact_example("INVOICE", "Invoice INV-1\n\n\nTotal 10.00", {
+        "invoice_number": "INV-1",
+        "line_items": [{"description": f"item {i}"} for i in range(5)],
+    })
+    assert "\n\n" not in example.split("Extracted Fields")[0]
+    assert '"line_items_omitted":2' in example
+
+    class Store:
+        def max_marginal_relevance_search(self, query, k, fetch_k, lambda_mult):
+            return [SimpleNamespace(page_content="a " * 400) for _ in range(k)]
+
+    snippets = select_examples(Store(), "query", top_k=3, max_tokens=150)
+    assert sum(count_tokens(s) for s in snippets) <= 150
+
+def test_guess_supplier_prefers_longest_known_name():
+    from src.core.rag_context import guess_supplier
+
+    names = ["Acme", "ACME Industrial, Inc.", "Globex"]
+    assert guess_supplier("Invoice from ACME Industrial Inc. #42", names) == "acme industrial inc"
+    assert guess_supplier("Payment to Acmeco", names) == ""
+
+def test_document_classifier_separates_invoices_purchase_orders_and_other():
+    from src.core.doc_classifier import SEED_DOCUMENTS, DocumentClassifier
+
+    classifier = DocumentClassifier().fit(SEED_DOCUMENTS)
+
+    def top(text):
+        probabilities = classifier.predict_proba(text)
+        return max(probabilities, key=probabilities.get)
+
+    assert top("INVOICE No 55 Invoice date Total amount due, please remit") == "invoice"
+    assert top("Purchase order PO number, vendor, ship to, buyer") == "po"
+    assert top("Minutes of the board meeting: attendees and agenda") == "other"
+
+def test_po_comparator_renders_report_without_llm():
+    from src.core.po_comparator import POComparator
+
+    comparator = POComparator.__new__(POComparator)  # no LLM client needed for the local report
+    invoice = {"invoice_number": "INV-1", "total_amount": "$20.00", "billing_address": "1 Main St",
+               "line_items": [{"description": "Bolts", "quantity": "2", "unit_price": "10", "amount": "20"}]}
+    po = {"po_number": "PO-1", "total": "$20.00",
+          "line_items": [{"description": "bolts", "quantity": "3", "unit_price": "10", "amount": "20"}]}
+
+    comparison = comparator.build_comparison(invoice, po)
+    severities = {d["message"].split(":")[0]: d["severity"] for d in comparison["discrepancies"]}
+    assert severities == {"Billing Address Discrepancy": "info", "Line item 'BOLTS'": "review"}
+
+    report = comparator.compare(invoice, po)
+    for section in ("Validation Status", "Discrepancy Found", "Next Steps", "Detailed Breakdown"):
+        assert f"<h2>{section}</h2>" in report
+    assert "Reconcile quantity for &#x27;BOLTS&#x27;." in report
+
+
+def test_po_comparator_memoizes_reports(tmp_path, monkeypatch):
+    from src.core.po_comparator import POComparator, comparison_key
+    from src.utils.cache import SQLiteCache
+
+    comparator = POComparator.__new__(POComparator)
+    comparator.report_cache = SQLiteCache(str(tmp_path / "reports.db"), max_entries=10)
+    invoice = {"invoice_number": "INV-1", "total_amount": "$20.00"}
+    po = {"po_number": "PO-1", "total": "$25.00"}
+
+    first = comparator.compare(invoice, po)
+    monkeypatch.setattr(comparator, "render_report", lambda *args, **kwargs: pytest.fail("report re-rendered"))
+    assert comparator.compare(dict(reversed(list(invoice.items()))), po) == first
+    assert comparator.report_cache.hits == 1
+    assert comparison_key(invoice, po) != comparison_key(invoice, {**po, "total": "$20.00"})
+
+
+
+def test_pdf_table_summary_rows_stay_in_header_text():
+    import pymupdf
+    from src.core.pdf_tables import extract_table_line_items
+
+    doc = pymupdf.open()
+    page = doc.new_page()
+    page.insert_text((50, 50), "INVOICE Invoice Number: INV-7")
+    rows = [("Description", "Qty", "Unit Price", "Amount"), ("Bolts", "2", "1.00", "2.00"),
+            ("Nuts", "3", "2.00", "6.00"), ("Total", "", "", "8.00")]
+    columns = [50, 250, 350, 450, 550]
+    for r, row in enumerate(rows):
+        top = 80 + r * 20
+        for c, cell in enumerate(row):
+            page.draw_rect(pymupdf.Rect(columns[c], top, columns[c + 1], top + 20))
+            page.insert_text((columns[c] + 3, top + 14), cell)
+
+    line_items, text = extract_table_line_items(doc)
+    assert [item["description"] for item in line_items] == ["Bolts", "Nuts"]
+    assert line_items[1] == {"description": "Nuts", "quantity": "3", "unit_price": "2.00", "amount": "6.00"}
+    assert "INV-7" in text
+    assert "Total 8.00" in text
+    assert "Bolts" not in text
@@ -0,0 +1,232 @@
+import os
+import pytest
+from src.utils.cache import SQLiteCache
+
+
+def test_sqlite_cache_evicts_least_recently_used(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"  # "a" is now more recently used than "b"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_sqlite_cache_respects_max_bytes(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), max_bytes=10)
+    cache.set("a", "x" * 6)
+    cache.set("b", "y" * 6)
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 6
+
+
+
+def test_sqlite_cache_expires_entries_after_ttl(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), ttl=60)
+    cache.set("a", "1")
+    assert cache.get("a") == "1"
+    cache.ttl = -1  # every entry is now older than the TTL
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+class _FakeCollection:
+    def __init__(self):
+        self.upserts = []
+
+    def upsert(self, ids, embeddings, documents, metadatas=None):
+        self.upserts.append(documents)
+
+
+class _FakeVectorStore:
+    def __init__(self):
+        self._collection = _FakeCollection()
+        self.persist_calls = 0
+
+    def persist(self):
+        self.persist_calls += 1
+
+
+class _FakeEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+def test_vector_store_writer_batches_embeddings_and_persist():
+    from src.utils.vector_stores import VectorStoreWriter
+
+    store, embeddings = _FakeVectorStore(), _FakeEmbeddings()
+    writer = VectorStoreWriter(store, embeddings, batch_size=3, max_delay=0)
+    writer.add("a")
+    writer.add("b", embedding=[0.5])
+    assert store._collection.upserts == []
+    writer.add("c")  # reaching batch_size flushes
+    assert store._collection.upserts == [["a", "b", "c"]]
+    assert embeddings.calls == [["a", "c"]]
+    assert store.persist_calls == 1
+    assert writer.flush() == 0
+
+
+def test_vector_store_writer_requeues_failed_batch():
+    from src.utils.vector_stores import VectorStoreWriter
+
+    store, embeddings = _FakeVectorStore(), _FakeEmbeddings()
+    writer = VectorStoreWriter(store, embeddings, batch_size=2, max_delay=0)
+    upsert = store._collection.upsert
+
+    def failing_upsert(**kwargs):
+        raise RuntimeError("store unavailable")
+    store._collection.upsert = failing_upsert
+    writer.add("a")
+    writer.add("b")  # the batch-full flush fails: logged, not raised
+    with pytest.raises(RuntimeError):
+        writer.flush()
+
+    store._collection.upsert = upsert
+    assert writer.flush() == 2
+    assert store._collection.upserts == [["a", "b"]]
+
+
+class _FakeFilteringStore(_FakeVectorStore):
+    """Fake store that keeps metadata and answers get()/delete() like Chroma."""
+
+    def __init__(self):
+        super().__init__()
+        self.entries = {}
+        self._collection.upsert = self._upsert
+
+    def _upsert(self, ids, embeddings, documents, metadatas=None):
+        for i, document, metadata in zip(ids, documents, metadatas or [None] * len(ids)):
+            self.entries[i] = (document, metadata)
+
+    def get(self, where=None, include=None):
+        (key, condition), = where.items()
+        values = condition["$in"] if isinstance(condition, dict) else [condition]
+        matches = [(i, m) for i, (_, m) in self.entries.items() if m and m.get(key) in values]
+        return {"ids": [i for i, _ in matches], "metadatas": [m for _, m in matches]}
+
+    def delete(self, ids):
+        for i in ids:
+            del self.entries[i]
+
+
+def test_vector_store_writer_deduplicates_and_caps_per_supplier():
+    from src.utils.vector_stores import VectorStoreWriter
+
+    store = _FakeFilteringStore()
+    writer = VectorStoreWriter(store, _FakeEmbeddings(), batch_size=100, max_delay=0, max_per_supplier=2)
+    for n in range(3):
+        writer.add(f"doc {n}", metadata={"content_hash": f"h{n}", "supplier": "acme", "created_at": n})
+    writer.add("doc 0 again", metadata={"content_hash": "h0", "supplier": "acme", "created_at": 9})
+    writer.flush()
+    assert sorted(d for d, _ in store.entries.values()) == ["doc 1", "doc 2"]
+
+    writer.add("doc 2 resent", metadata={"content_hash": "h2", "supplier": "acme", "created_at": 10})
+    assert writer.flush() == 0
+
+
+def test_vector_store_writer_does_not_cap_unknown_supplier():
+    from src.utils.vector_stores import VectorStoreWriter
+
+    store = _FakeFilteringStore()
+    writer = VectorStoreWriter(store, _FakeEmbeddings(), batch_size=100, max_delay=0, max_per_supplier=2)
+    for n in range(5):
+        writer.add(f"doc {n}", metadata={"content_hash": f"h{n}", "supplier": "", "created_at": n})
+    writer.flush()
+    assert len(store.entries) == 5
+
+
+def test_compact_vector_store_swaps_in_rebuilt_collection(tmp_path, monkeypatch):
+    from src.utils import vector_stores
+
+    monkeypatch.setattr(vector_stores, "VECTOR_BACKEND", "faiss")
+    monkeypatch.setattr(vector_stores, "VECTOR_STORES",
+                        {"invoices": {"persist_directory": str(tmp_path), "collection_name": "invoices"}})
+    monkeypatch.setattr(vector_stores, "_embeddings", _FakeEmbeddings())
+    monkeypatch.setattr(vector_stores, "_vector_stores", {})
+    monkeypatch.setattr(vector_stores, "_writers", {})
+
+    store = vector_stores.get_vector_store("invoices")
+    metadatas = [{"supplier": "acme", "created_at": n} for n in range(3)] + [{"supplier": "", "created_at": 3}]
+    vector_stores.add_texts_with_embeddings(store, ["a0", "a1", "a2", "x"], [[float(n)] for n in range(4)],
+                                            metadatas)
+    vector_stores.add_texts_with_embeddings(store, ["legacy 1", "legacy 2", "legacy 1"], [[5.0], [6.0], [7.0]])
+
+    assert vector_stores.compact_vector_store("invoices", max_per_supplier=2) == (7, 5)
+    documents = vector_stores.get_vector_store("invoices").get(include=["documents"])["documents"]
+    assert sorted(documents) == ["a1", "a2", "legacy 1", "legacy 2", "x"]
+    assert sorted(os.listdir(tmp_path)) == ["invoices.db", "invoices.shards"]
+
+
+def test_faiss_store_appends_shards_and_merges_small_ones(tmp_path):
+    from src.utils.faiss_store import FaissVectorStore
+
+    store = FaissVectorStore(persist_directory=str(tmp_path), collection_name="examples", max_shards=2)
+    ids = []
+    for batch in range(4):  # one shard per add; the third and fourth adds trigger merges
+        ids += store.add_embeddings([f"doc {batch}"], [[float(batch), 0.0]], [{"supplier": "acme"}])
+    assert len(os.listdir(tmp_path / "examples.shards")) <= 2
+
+    store.delete(ids=[ids[1]])
+    nearest = store.similarity_search_by_vector_with_relevance_scores([1.25, 0.0], k=2)
+    assert [(doc.page_content, distance) for doc, distance in nearest] == [("doc 2", 0.5625), ("doc 0", 1.5625)]
+    assert len(store.max_marginal_relevance_search_by_vector([1.0, 0.0], k=2, fetch_k=3)) == 2
+
+    reopened = FaissVectorStore(persist_directory=str(tmp_path), collection_name="examples", max_shards=2)
+    data = reopened.get(include=["documents", "embeddings"])
+    assert data["documents"] == ["doc 0", "doc 2", "doc 3"]
+    assert data["embeddings"] == [[0.0, 0.0], [2.0, 0.0], [3.0, 0.0]]
+
+
+def test_token_bucket_limiter_waits_for_token_budget(monkeypatch):
+    from src.utils import concurrency
+
+    clock = [0.0]
+    sleeps = []
+    monkeypatch.setattr(concurrency.time, "monotonic", lambda: clock[0])
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+    monkeypatch.setattr(concurrency.time, "sleep", fake_sleep)
+
+    limiter = concurrency.TokenBucketLimiter(requests_per_minute=0, tokens_per_minute=600)
+    limiter.acquire(600)
+    assert sleeps == []
+    limiter.acquire(300)  # bucket is empty; 300 tokens refill in 30 seconds
+    assert sleeps == [30.0]
+
+
+def test_map_concurrently_keeps_input_order_or_streams_indexes():
+    from src.utils.concurrency import map_concurrently
+
+    assert map_concurrently(lambda x: x * 2, [3, 1, 2], max_workers=3) == [6, 2, 4]
+    streamed = dict(map_concurrently(lambda x: x * 2, [3, 1, 2], max_workers=3, ordered=False))
+    assert streamed == {0: 6, 1: 2, 2: 4}
+
+
+def test_invoke_with_quota_skips_quota_on_cache_hit(tmp_path, monkeypatch):
+    from langchain_core.language_models import FakeListChatModel
+    from src.utils import llm_clients
+    from src.utils.llm_cache import LLMResponseCache
+
+    charged = []
+    monkeypatch.setattr(llm_clients, "wait_for_openai_quota", charged.append)
+    class QuotaChargedFake(llm_clients.QuotaChargedMixin, FakeListChatModel):
+        pass
+
+    cache = LLMResponseCache(SQLiteCache(str(tmp_path / "llm.db")))
+    llm = QuotaChargedFake(responses=["first", "second"], cache=cache)
+
+    assert llm_clients.invoke_with_quota(llm, "prompt", 10).content == "first"
+    assert llm_clients.invoke_with_quota(llm, "prompt", 10).content == "first"
+    assert charged == [10]
+    assert llm_clients.invoke_with_quota(llm, "other prompt", 20).content == "second"
+    assert charged == [10, 20]
+    assert cache.stats() == {"hits": 1, "misses": 2}